@@ -0,0 +1,160 @@
+import asyncio
+import itertools
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+from starlette.requests import Request
+
+from app.chat.exceptions import QueueFullException, RateLimitExceededException
+from app.config import settings
+
+
+class AdmissionController:
+    """
+    Limits the number of concurrent generations on one LLM backend.
+    Admitted requests reserve a place until they ask for a slot, together with the requests waiting in the FIFO
+    queue they may exceed the free slots by at most `max_queue_depth`, the rest are rejected.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue_depth: int, reservation_ttl: float = 60):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.reservation_ttl = reservation_ttl
+        self.active = 0
+        self.hold_time: Optional[float] = None  # Moving average of seconds a slot is held
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._reservations: Dict[int, float] = {}  # Reservation id to its expiry
+        self._reservation_ids = itertools.count()
+
+    @property
+    def reserved(self) -> int:
+        # A request that never asked for its slot (e.g. the client went away mid retrieval) can't hold it forever
+        now = time.monotonic()
+        for reservation, expires in list(self._reservations.items()):
+            if expires < now:
+                del self._reservations[reservation]
+        return len(self._reservations)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def outstanding(self) -> int:
+        return self.active + self.reserved + self.queued
+
+    def has_free_slot(self) -> bool:
+        return self.active < self.max_concurrency and not self._waiters
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil((self.hold_time or 10) * (self.outstanding - self.active + 1) / self.max_concurrency))
+
+    def check_depth(self):
+        if self.outstanding >= self.max_concurrency + self.max_queue_depth:
+            raise QueueFullException(retry_after=self.retry_after())
+
+    def admit(self) -> Tuple[int, int]:
+        """
+        Reject the request right away when the queue is full, otherwise reserve a place for it.
+        Returns the reservation, handed to `acquire` or `cancel`, and the expected queue position.
+        """
+        self.check_depth()
+        position = max(0, self.outstanding - self.max_concurrency + 1)
+        reservation = next(self._reservation_ids)
+        self._reservations[reservation] = time.monotonic() + self.reservation_ttl
+        return reservation, position
+
+    def cancel(self, reservation: int):
+        self._reservations.pop(reservation, None)
+
+    async def acquire(self, reservation: Optional[int] = None):
+        if reservation is not None:
+            self.cancel(reservation)
+        elif not self.has_free_slot():
+            # Not admitted here, e.g. failing over from another backend, so the depth is checked now
+            self.check_depth()
+
+        if self.has_free_slot():
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over right before the cancellation, pass it on
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+    def release(self):
+        # The slot goes straight to the next waiter, so a new request can't overtake the queue
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def fail_waiters(self, error: Exception):
+        """
+        Wake every queued request with `error`, used when the backend goes away
+        """
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    @asynccontextmanager
+    async def slot(self, reservation: Optional[int] = None):
+        await self.acquire(reservation)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release()
+            held = time.monotonic() - started
+            self.hold_time = held if self.hold_time is None else 0.8 * self.hold_time + 0.2 * held
+
+
+class RateLimiter:
+    """
+    Token bucket per client, `rate` requests per second on average with bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def check(self, client: str):
+        if self.rate <= 0:
+            return
+
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            raise RateLimitExceededException(retry_after=math.ceil((1 - tokens) / self.rate))
+
+        self._buckets[client] = (tokens - 1, now)
+        self._buckets.move_to_end(client)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+
+def client_id(request: Request) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED and (forwarded := request.headers.get("X-Forwarded-For")):
+        return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+rate_limiter = RateLimiter(rate=settings.RATE_LIMIT_REQUESTS / 60, burst=settings.RATE_LIMIT_BURST)
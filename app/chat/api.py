@@ -1,6 +1,10 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from starlette.background import BackgroundTask
+from starlette.requests import Request
 from starlette.responses import StreamingResponse
 
+from app.chat.admission import client_id, rate_limiter
+from app.chat.dependencies import get_completion_service
 from app.chat.models import Message
 from app.chat.services import CompletionService
 
@@ -9,6 +13,19 @@ router = APIRouter(tags=["Core Endpoints"])
 
 
 @router.post("/v1/completion")
-async def completion_create(input_message: Message) -> StreamingResponse:
-    stream_response = await CompletionService.with_stream(input_message)
-    return StreamingResponse(stream_response(), media_type='text/event-stream')
+async def completion_create(
+    input_message: Message,
+    request: Request,
+    service: CompletionService = Depends(get_completion_service),
+) -> StreamingResponse:
+    rate_limiter.check(client_id(request))
+    ticket = service.llm_router.admit(service.model(input_message))
+
+    stream_response = await service.with_stream(input_message, ticket)
+    return StreamingResponse(
+        stream_response(),
+        media_type='text/event-stream',
+        headers={"X-Queue-Position": str(ticket.position)},
+        # Also frees the reserved place when the stream never started
+        background=BackgroundTask(ticket.release),
+    )
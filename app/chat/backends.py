@@ -0,0 +1,327 @@
+import asyncio
+import random
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional
+
+import httpx
+
+from app.chat.admission import AdmissionController
+from app.chat.exceptions import BackendError, BackendUnavailableException, QueueFullException
+from app.chat.streaming import ollama_chat_request, ollama_tokens
+from app.config import settings
+from app.core.logs import logger
+from app.core.metrics import STAGE_SECONDS
+
+if TYPE_CHECKING:
+    # Imported when the OpenAI client is created, keeps it out of the API's import time
+    from openai import AsyncOpenAI
+
+
+class Backend(ABC):
+    """
+    One LLM endpoint with its own concurrency limit. A backend failing EJECT_AFTER_FAILURES times in a row
+    is ejected for EJECT_SECONDS, requests waiting in its queue fail over to another backend.
+    """
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.controller = AdmissionController(
+            name, max_concurrency, settings.MAX_QUEUE_DEPTH, settings.ADMISSION_RESERVATION_TTL
+        )
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until <= time.monotonic()
+
+    @property
+    def outstanding(self) -> int:
+        return self.controller.outstanding
+
+    @abstractmethod
+    def serves(self, model: str) -> bool:
+        ...
+
+    @abstractmethod
+    def stream(self, messages: List[dict], model: str) -> AsyncIterator[str]:
+        ...
+
+    @abstractmethod
+    async def generate(self, prompt: str, model: str) -> str:
+        ...
+
+    async def check_health(self) -> bool:
+        """
+        Backends without an active check come back once their ejection expires
+        """
+        return self.healthy
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        logger.warning(f"Backend {self.name} failed ({self.failures} in a row): {error}")
+        if self.failures >= settings.EJECT_AFTER_FAILURES and self.healthy:
+            self.eject()
+
+    def eject(self):
+        logger.error(f"Ejecting backend {self.name} for {settings.EJECT_SECONDS}s")
+        self.ejected_until = time.monotonic() + settings.EJECT_SECONDS
+        self.controller.fail_waiters(BackendError(f"Backend {self.name} was ejected"))
+
+    def restore(self):
+        if not self.healthy:
+            logger.info(f"Backend {self.name} is healthy again")
+        self.failures = 0
+        self.ejected_until = 0.0
+
+
+class OllamaBackend(Backend):
+    def __init__(self, host: str, http_client: httpx.AsyncClient):
+        super().__init__(host, settings.OLLAMA_MAX_CONCURRENCY)
+        self.host = host.rstrip("/")
+        self.http_client = http_client
+        self.models: Optional[set] = None  # Pulled models, known after the first health check
+
+    def serves(self, model: str) -> bool:
+        if model in settings.OPENAI_MODELS:
+            return False
+        return self.models is None or model in self.models
+
+    async def stream(self, messages, model):
+        started = time.perf_counter()
+        async with self.http_client.stream(
+            "POST", f"{self.host}/api/chat", json=ollama_chat_request(model, messages)
+        ) as response:
+            STAGE_SECONDS.labels("upstream_connect").observe(time.perf_counter() - started)
+            async for token in ollama_tokens(response):
+                yield token
+
+    async def generate(self, prompt, model):
+        response = await self.http_client.post(
+            f"{self.host}/api/generate",
+            json={"model": model, "prompt": prompt, "stream": False, "keep_alive": settings.OLLAMA_KEEP_ALIVE},
+        )
+        response.raise_for_status()
+        return response.json()["response"]
+
+    async def check_health(self) -> bool:
+        response = await self.http_client.get(f"{self.host}/api/tags", timeout=settings.HEALTH_CHECK_TIMEOUT)
+        response.raise_for_status()
+        self.models = {model["name"].split(":")[0] for model in response.json().get("models", [])}
+        return True
+
+    async def preload(self, model: str):
+        """
+        Load the model into memory ahead of the first request, a generate request without a prompt only loads it
+        """
+        try:
+            response = await self.http_client.post(
+                f"{self.host}/api/generate", json={"model": model, "keep_alive": settings.OLLAMA_KEEP_ALIVE}
+            )
+            response.raise_for_status()
+            logger.info(f"Preloaded {model} on {self.host}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to preload {model} on {self.host}: {e}")
+
+
+class OpenAIBackend(Backend):
+    """
+    OpenAI API errors are raised as BackendError, so the router fails over without importing openai itself
+    """
+
+    def __init__(self, client: "AsyncOpenAI"):
+        super().__init__("openai", settings.OPENAI_MAX_CONCURRENCY)
+        self.client = client
+
+    def serves(self, model: str) -> bool:
+        return model in settings.OPENAI_MODELS
+
+    async def stream(self, messages, model):
+        from openai import APIError
+
+        started = time.perf_counter()
+        try:
+            stream = await self.client.chat.completions.create(model=model, messages=messages, stream=True)
+        except APIError as e:
+            raise BackendError(str(e)) from e
+        STAGE_SECONDS.labels("upstream_connect").observe(time.perf_counter() - started)
+        try:
+            async for event in stream:
+                if current_response := event.choices[0].delta.content:
+                    yield current_response
+        except APIError as e:
+            raise BackendError(str(e)) from e
+        finally:
+            await stream.response.aclose()
+
+    async def generate(self, prompt, model):
+        from openai import APIError
+
+        try:
+            response = await self.client.chat.completions.create(
+                model=model, messages=[{"role": "user", "content": prompt}]
+            )
+        except APIError as e:
+            raise BackendError(str(e)) from e
+        return response.choices[0].message.content
+
+
+@dataclass
+class Ticket:
+    """
+    Place reserved in a backend's queue when the request was admitted, used by its first generation attempt
+    """
+
+    backend: Backend
+    reservation: int
+    position: int
+    used: bool = False
+
+    def take(self) -> Optional[int]:
+        """
+        The reservation for the first attempt, None once it was used or when the backend was ejected meanwhile
+        """
+        if self.used:
+            return None
+        self.used = True
+        if not self.backend.healthy:
+            self.backend.controller.cancel(self.reservation)
+            return None
+        return self.reservation
+
+    def release(self):
+        if not self.used:
+            self.used = True
+            self.backend.controller.cancel(self.reservation)
+
+
+class LLMRouter:
+    """
+    Routes every request to the healthy backend serving the model with the fewest outstanding requests.
+    A backend that fails before the first token is streamed is retried on another one.
+    """
+
+    def __init__(self, backends: List[Backend]):
+        self.backends = backends
+
+    @property
+    def default_model(self) -> str:
+        if settings.DEFAULT_MODEL:
+            return settings.DEFAULT_MODEL
+        if any(isinstance(backend, OpenAIBackend) for backend in self.backends):
+            return settings.OPENAI_MODELS[0]
+        return settings.DEFAULT_OLLAMA_MODEL
+
+    def candidates(self, model: str, exclude: set = frozenset()) -> List[Backend]:
+        return [
+            backend for backend in self.backends
+            if backend.healthy and backend.serves(model) and backend.name not in exclude
+        ]
+
+    def pick(self, model: str, exclude: set = frozenset()) -> Optional[Backend]:
+        candidates = self.candidates(model, exclude)
+        if not candidates:
+            return None
+        least = min(backend.outstanding for backend in candidates)
+        return random.choice([backend for backend in candidates if backend.outstanding == least])
+
+    def admit(self, model: str) -> Ticket:
+        """
+        Reject the request right away when no backend can take it, otherwise reserve a place on the least busy one
+        """
+        candidates = self.candidates(model)
+        if not candidates:
+            raise BackendUnavailableException(model)
+
+        rejections = []
+        for backend in sorted(candidates, key=lambda backend: (backend.outstanding, random.random())):
+            try:
+                reservation, position = backend.controller.admit()
+                return Ticket(backend, reservation, position)
+            except QueueFullException as e:
+                rejections.append(e)
+        raise min(rejections, key=lambda e: int(e.headers["Retry-After"]))
+
+    async def stream(
+        self, messages: List[dict], model: str, ticket: Optional[Ticket] = None
+    ) -> AsyncIterator[str]:
+        tried = set()
+        while True:
+            reservation = ticket.take() if ticket else None
+            backend = ticket.backend if reservation is not None else self.pick(model, exclude=tried)
+            if backend is None:
+                break
+            tried.add(backend.name)
+            started = False
+            try:
+                async with backend.controller.slot(reservation):
+                    async for token in backend.stream(messages, model):
+                        started = True
+                        yield token
+                backend.record_success()
+                return
+            except QueueFullException:
+                logger.warning(f"Queue of backend {backend.name} is full, trying another one")
+            except (BackendError, httpx.HTTPError) as e:
+                backend.record_failure(e)
+                if started:
+                    raise BackendError(f"Backend {backend.name} failed mid-stream, the answer is incomplete")
+                logger.warning(f"Failing over from backend {backend.name}")
+
+        raise BackendError(f"No backend left to serve {model}, tried: {', '.join(tried) or 'none'}")
+
+    async def generate(self, prompt: str, model: str) -> str:
+        """
+        Generate a whole answer, e.g. a history summary, through the same slots and failover as streamed answers
+        """
+        tried = set()
+        while backend := self.pick(model, exclude=tried):
+            tried.add(backend.name)
+            try:
+                async with backend.controller.slot():
+                    result = await backend.generate(prompt, model)
+                backend.record_success()
+                return result
+            except QueueFullException:
+                logger.warning(f"Queue of backend {backend.name} is full, trying another one")
+            except (BackendError, httpx.HTTPError) as e:
+                backend.record_failure(e)
+                logger.warning(f"Failing over from backend {backend.name}")
+
+        if not tried:
+            raise BackendUnavailableException(model)
+        raise BackendError(f"No backend left to serve {model}, tried: {', '.join(tried)}")
+
+    async def check_health(self):
+        for backend in self.backends:
+            try:
+                # Only brings back ejected backends, consecutive request failures are reset by a successful request
+                if await backend.check_health() and backend.ejected_until:
+                    backend.restore()
+            except (BackendError, httpx.HTTPError) as e:
+                backend.record_failure(e)
+
+    async def run_health_checks(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(settings.HEALTH_CHECK_INTERVAL)
+
+    async def preload(self, model: str):
+        await asyncio.gather(*(
+            backend.preload(model) for backend in self.backends
+            if isinstance(backend, OllamaBackend) and backend.serves(model)
+        ))
+
+
+def create_router(http_client: httpx.AsyncClient, openai_client: Optional["AsyncOpenAI"]) -> LLMRouter:
+    backends: List[Backend] = [
+        OllamaBackend(host, http_client) for host in settings.OLLAMA_HOSTS or [settings.OLLAMA_HOST]
+    ]
+    if openai_client:
+        backends.append(OpenAIBackend(openai_client))
+    return LLMRouter(backends)
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from app.config import settings
+
+T = TypeVar("T")
+
+
+def index_version() -> Optional[int]:
+    """
+    Version of the indexed collection, bumped by `scraper/insert_data.py` every time it (re)builds the collection
+    """
+    try:
+        return os.stat(settings.INDEX_VERSION_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class TTLCache(Generic[T]):
+    """
+    LRU cache with a time-to-live on every entry
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: T):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCache(Generic[T]):
+    """
+    SQLite backed cache with the same interface as TTLCache, values are stored as JSON and survive restarts
+    """
+
+    def __init__(self, path: str, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[T]:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            self._connection.execute("UPDATE cache SET used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value: T):
+        if self.maxsize <= 0:
+            return
+
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, json.dumps(value), now + self.ttl, now)
+            )
+            self._connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class SemanticCache(Generic[T]):
+    """
+    Cache keyed on embeddings, a lookup hits when the cosine similarity to a cached vector is above the threshold
+    """
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._vectors: List[np.ndarray] = []
+        self._entries: List[Tuple[float, T]] = []
+        self._lock = threading.Lock()
+
+    def get(self, vector: List[float]) -> Optional[T]:
+        with self._lock:
+            self._evict_expired()
+            if not self._vectors:
+                self.misses += 1
+                return None
+
+            similarities = np.stack(self._vectors) @ _normalize(vector)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._entries[best][1]
+
+    def set(self, vector: List[float], value: T):
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._vectors.append(_normalize(vector))
+            self._entries.append((time.monotonic() + self.ttl, value))
+            if len(self._vectors) > self.maxsize:
+                del self._vectors[0]
+                del self._entries[0]
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+            self._entries.clear()
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = 0
+        while expired < len(self._entries) and self._entries[expired][0] < now:
+            expired += 1
+        del self._vectors[:expired]
+        del self._entries[:expired]
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+
+class RetrievalCache:
+    """
+    Two tier cache in front of the vector search: exact normalized query first, then nearby query embeddings
+    """
+
+    def __init__(self):
+        self.exact: TTLCache[Any] = TTLCache(
+            maxsize=settings.RETRIEVAL_CACHE_SIZE, ttl=settings.RETRIEVAL_CACHE_TTL
+        )
+        self.semantic: SemanticCache[Any] = SemanticCache(
+            maxsize=settings.SEMANTIC_CACHE_SIZE,
+            ttl=settings.RETRIEVAL_CACHE_TTL,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        )
+        self._index_version = index_version()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def get(self, query: str) -> Optional[Any]:
+        self._check_index_version()
+        return self.exact.get(self.normalize(query))
+
+    def get_similar(self, query: str, vector: List[float]) -> Optional[Any]:
+        value = self.semantic.get(vector)
+        if value is not None:
+            self.exact.set(self.normalize(query), value)
+        return value
+
+    def set(self, query: str, vector: List[float], value: Any):
+        self.exact.set(self.normalize(query), value)
+        self.semantic.set(vector, value)
+
+    def clear(self):
+        self.exact.clear()
+        self.semantic.clear()
+
+    def stats(self) -> dict:
+        return {
+            "exact": {"size": len(self.exact), "hits": self.exact.hits, "misses": self.exact.misses},
+            "semantic": {"size": len(self.semantic), "hits": self.semantic.hits, "misses": self.semantic.misses},
+        }
+
+    def _check_index_version(self):
+        current_version = index_version()
+        if current_version != self._index_version:
+            self._index_version = current_version
+            self.clear()
+
+
+class CompletionCache:
+    """
+    Generated answers keyed on the model and the exact messages sent to it, cleared when the collection is re-indexed
+    """
+
+    def __init__(self):
+        self.enabled = settings.COMPLETION_CACHE_ENABLED
+        self.cache = None
+        if self.enabled:
+            if settings.COMPLETION_CACHE_BACKEND == "disk":
+                self.cache = DiskCache(
+                    settings.COMPLETION_CACHE_FILE,
+                    maxsize=settings.COMPLETION_CACHE_SIZE,
+                    ttl=settings.COMPLETION_CACHE_TTL,
+                )
+            else:
+                self.cache = TTLCache(maxsize=settings.COMPLETION_CACHE_SIZE, ttl=settings.COMPLETION_CACHE_TTL)
+        self._index_version = index_version()
+
+    def key(self, model: str, messages: List[dict]) -> str:
+        # The index version is part of the key, so entries persisted on disk before a re-index never match
+        content = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+        return f"{self._index_version}:{hashlib.sha256(content.encode('utf-8')).hexdigest()}"
+
+    def get(self, model: str, messages: List[dict]) -> Optional[List[str]]:
+        if not self.enabled:
+            return None
+        self._check_index_version()
+        return self.cache.get(self.key(model, messages))
+
+    def set(self, model: str, messages: List[dict], tokens: List[str]):
+        if self.enabled and tokens:
+            self.cache.set(self.key(model, messages), tokens)
+
+    def _check_index_version(self):
+        current_version = index_version()
+        if current_version != self._index_version:
+            self._index_version = current_version
+            self.cache.clear()
+
+
+def _normalize(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+retrieval_cache = RetrievalCache()
+completion_cache = CompletionCache()
@@ -0,0 +1,33 @@
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+
+from app.config import settings
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Long-lived pooled client shared by every completion request. HTTP/2 is negotiated via ALPN,
+    so plain-http backends (like a local Ollama) keep using HTTP/1.1 keep-alive connections.
+    """
+    return httpx.AsyncClient(
+        timeout=settings.HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=settings.HTTP2,
+    )
+
+
+def create_openai_client(http_client: httpx.AsyncClient) -> Optional["AsyncOpenAI"]:
+    if not settings.OPENAI_KEY:
+        return None
+
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(api_key=settings.OPENAI_KEY, http_client=http_client)
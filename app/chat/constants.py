@@ -5,6 +5,10 @@ class FailureReason(Enum):
     NO_DOCUMENTS_FOUND: str = (
         "No documents found in context. Please try again with a different query."
     )
+    QUEUE_FULL: str = "Too many requests are waiting for an answer. Please try again later."
+    RATE_LIMIT_EXCEEDED: str = "You are sending messages too fast. Please try again later."
+    NO_BACKEND_AVAILABLE: str = "No model backend is available right now. Please try again later."
+    ANSWER_INTERRUPTED: str = "The answer was interrupted. Please try again."
 
 
 class RoleEnum(Enum):
@@ -16,3 +20,5 @@ class RoleEnum(Enum):
 class ModelEnum(Enum):
     MISTRAL: str = "mistral"
     MIXTRAL: str = "mixtral"
+    GPT_3_5_TURBO: str = "gpt-3.5-turbo"
+    GPT_4: str = "gpt-4"
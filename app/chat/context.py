@@ -0,0 +1,119 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from qdrant_client.fastembed_common import QueryResponse
+
+from app.chat.tokens import count_tokens, truncate
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+@dataclass
+class ContextBlock:
+    document: str
+    source: str
+    score: float
+    chunk: Optional[int] = None
+    last_chunk: Optional[int] = None
+
+
+def shingles(text: str, size: int = 3) -> set:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def join_overlapping(first: str, second: str) -> str:
+    """
+    Concatenate two neighbouring chunks, dropping the text they share at the boundary
+    """
+    for size in range(min(len(first), len(second)), 0, -1):
+        if first.endswith(second[:size]) and (size > 20 or size == len(second)):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+
+def deduplicate(results: List[QueryResponse], threshold: float) -> List[QueryResponse]:
+    """
+    Drop results that are near copies of a better scored one, compared by word shingle overlap
+    """
+    kept, kept_shingles = [], []
+    for result in sorted(results, key=lambda result: result.score, reverse=True):
+        result_shingles = shingles(result.document)
+        if any(similarity(result_shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(result)
+        kept_shingles.append(result_shingles)
+    return kept
+
+
+def source_of(result: QueryResponse) -> str:
+    # Files downloaded without a recorded url have no path
+    return (result.metadata.get("path") or result.metadata.get("filename") or "Unknown source").strip()
+
+
+def merge_adjacent(results: List[QueryResponse]) -> List[ContextBlock]:
+    """
+    Merge chunks that follow each other in the same file into one block, scored by its best chunk
+    """
+    blocks: List[ContextBlock] = []
+    ordered = sorted(
+        results,
+        key=lambda result: (source_of(result), result.metadata.get("chunk", -1)),
+    )
+    for result in ordered:
+        source = source_of(result)
+        chunk = result.metadata.get("chunk")
+        previous = blocks[-1] if blocks else None
+
+        if previous and chunk is not None and previous.source == source and previous.last_chunk == chunk - 1:
+            previous.document = join_overlapping(previous.document, result.document.strip())
+            previous.score = max(previous.score, result.score)
+            previous.last_chunk = chunk
+            continue
+
+        blocks.append(
+            ContextBlock(
+                document=result.document.strip(),
+                source=source,
+                score=result.score,
+                chunk=chunk,
+                last_chunk=chunk,
+            )
+        )
+    return sorted(blocks, key=lambda block: block.score, reverse=True)
+
+
+def format_block(i: int, block: ContextBlock) -> str:
+    return f"CONTEXT {i}:\n{block.document}\nSOURCE {i}: {block.source}\n"
+
+
+def build_context(results: List[QueryResponse], token_budget: int, dedup_threshold: float) -> List[str]:
+    """
+    Deduplicate, merge and order the retrieved chunks, then pack as many as fit into `token_budget` tokens.
+    The best block is truncated when it doesn't fit on its own, so the context is never empty.
+    """
+    blocks = merge_adjacent(deduplicate(results, dedup_threshold))
+
+    context, used = [], 0
+    for block in blocks:
+        formatted = format_block(len(context) + 1, block)
+        tokens = count_tokens(formatted)
+        if used + tokens <= token_budget:
+            context.append(formatted)
+            used += tokens
+        elif not context:
+            overhead = count_tokens(format_block(1, ContextBlock(document="", source=block.source, score=0)))
+            if document := truncate(block.document, token_budget - overhead):
+                block.document = document
+                context.append(format_block(1, block))
+                used += count_tokens(context[-1])
+    return context
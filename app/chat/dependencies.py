@@ -0,0 +1,7 @@
+from starlette.requests import Request
+
+from app.chat.services import CompletionService
+
+
+def get_completion_service(request: Request) -> CompletionService:
+    return CompletionService(llm_router=request.app.state.llm_router)
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from app.config import settings
+from app.core.logs import logger
+
+_model = None
+_model_lock = threading.Lock()
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.EMBEDDING_WORKERS, thread_name_prefix="embedding"
+)
+
+
+def get_model():
+    """
+    Load the query embedding model. Collections embedded with `sentence_transformers` by the scraper
+    use the same weights as the fastembed model of the same name, so they are queried with fastembed.
+    The API loads it while starting up, see `app/main.py`.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = load_model()
+    return _model
+
+
+def load_model():
+    if settings.EMBEDDING_BACKEND == "openai":
+        from openai import OpenAI
+
+        return OpenAI(api_key=settings.OPENAI_KEY)
+
+    if settings.MODEL_OFFLINE:
+        import huggingface_hub.constants
+
+        # Read when the first Hub session is created, cached snapshots are used instead
+        huggingface_hub.constants.HF_HUB_OFFLINE = True
+
+    from fastembed import TextEmbedding
+
+    model = TextEmbedding(model_name=settings.EMBEDDING_MODEL, cache_dir=settings.MODEL_CACHE_DIR)
+    if settings.EMBEDDING_QUANTIZED:
+        quantize(model)
+    return model
+
+
+def quantize(model):
+    """
+    Swap the ONNX session of a fastembed model for an int8 dynamically quantized copy, written next to the model
+    in MODEL_CACHE_DIR the first time. Meant for models not published quantized already.
+    """
+    import onnxruntime as ort
+    from fastembed.common.model_management import locate_model_file
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    onnx_model = model.model
+    quantized_path = os.path.join(onnx_model._model_dir, "model_int8.onnx")
+    if not os.path.exists(quantized_path):
+        source = locate_model_file(onnx_model._model_dir, ["model.onnx", "model_optimized.onnx"])
+        logger.info(f"Quantizing {source} to int8")
+        quantize_dynamic(str(source), f"{quantized_path}.tmp", weight_type=QuantType.QInt8)
+        os.replace(f"{quantized_path}.tmp", quantized_path)
+
+    session = onnx_model.model
+    onnx_model.model = ort.InferenceSession(
+        quantized_path, sess_options=session.get_session_options(), providers=session.get_providers()
+    )
+
+
+def vector_name() -> str:
+    """
+    Name of the vector field in the collection, same naming as scraper/embeddings.py uses
+    """
+    if settings.EMBEDDING_BACKEND == "openai":
+        return settings.EMBEDDING_MODEL
+    return f"fast-{settings.EMBEDDING_MODEL.split('/')[-1].lower()}"
+
+
+def embed_query(query: str) -> List[float]:
+    model = get_model()
+    if settings.EMBEDDING_BACKEND == "openai":
+        response = model.embeddings.create(input=[query.replace("\n", " ")], model=settings.EMBEDDING_MODEL)
+        return response.data[0].embedding
+    return next(iter(model.query_embed(query))).tolist()
+
+
+async def aembed_query(query: str) -> List[float]:
+    """
+    Embed the query in the bounded embedding thread pool, so the encoding doesn't block the event loop
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, embed_query, query)
+
+
+if __name__ == "__main__":
+    from app.chat.tokens import load_tokenizer
+
+    # Download (and quantize) the model and the chat tokenizer into MODEL_CACHE_DIR, so the API can start
+    # with MODEL_OFFLINE
+    embed_query("download")
+    load_tokenizer()
+    logger.info(f"{settings.EMBEDDING_MODEL} and {settings.TOKENIZER} are cached in {settings.MODEL_CACHE_DIR}")
@@ -2,6 +2,14 @@ from fastapi import HTTPException
 from app.chat.constants import FailureReason
 from starlette import status
 
+from app.config import settings
+
+
+class BackendError(Exception):
+    """
+    An LLM backend failed to serve a request, the router retries it on another backend
+    """
+
 
 class RetrievalNoDocumentsFoundException(HTTPException):
     def __init__(self):
@@ -9,3 +17,30 @@ class RetrievalNoDocumentsFoundException(HTTPException):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=FailureReason.NO_DOCUMENTS_FOUND,
         )
+
+
+class BackendUnavailableException(HTTPException):
+    def __init__(self, model: str):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{FailureReason.NO_BACKEND_AVAILABLE.value} ({model})",
+            headers={"Retry-After": str(settings.EJECT_SECONDS)},
+        )
+
+
+class QueueFullException(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=FailureReason.QUEUE_FULL.value,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class RateLimitExceededException(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=FailureReason.RATE_LIMIT_EXCEEDED.value,
+            headers={"Retry-After": str(retry_after)},
+        )
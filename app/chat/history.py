@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.chat.cache import TTLCache
+from app.chat.tokens import count_tokens, truncate
+from app.config import settings
+from app.core.logs import logger
+
+Summarizer = Callable[[str], Awaitable[str]]
+
+
+@dataclass
+class Summary:
+    count: int  # Number of leading messages covered by the summary
+    digest: str
+    text: str
+
+
+def digest(messages: List[dict]) -> str:
+    content = hashlib.sha1()
+    for message in messages:
+        content.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return content.hexdigest()
+
+
+def conversation_key(messages: List[dict], conversation_id: Optional[str]) -> str:
+    """
+    Conversations without an id are told apart by their first message
+    """
+    return conversation_id or digest(messages[:1])
+
+
+class HistoryManager:
+    """
+    Keeps the prompt history within a token budget. The most recent messages are sent verbatim,
+    older ones are replaced by a cached summary of the conversation, or truncated while the summary isn't ready.
+    Summaries are generated in the background, so a request never waits for one, and only once at least
+    `summary_min_messages` messages aren't covered by the previous one.
+    """
+
+    def __init__(
+        self,
+        recent_messages: int,
+        token_budget: int,
+        message_tokens: int,
+        summary_min_messages: int,
+        cache: TTLCache[Summary],
+    ):
+        self.recent_messages = recent_messages
+        self.token_budget = token_budget
+        self.message_tokens = message_tokens
+        self.summary_min_messages = summary_min_messages
+        self.cache = cache
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def cached_summary(self, key: str, older: List[dict]) -> Optional[Summary]:
+        summary = self.cache.get(key)
+        if summary is None or summary.count > len(older) or summary.digest != digest(older[: summary.count]):
+            return None
+        return summary
+
+    def compact(
+        self, messages: List[dict], conversation_id: Optional[str] = None, summarizer: Optional[Summarizer] = None
+    ) -> List[dict]:
+        split = max(len(messages) - self.recent_messages, 0)
+        older, recent = messages[:split], messages[split:]
+        if not older:
+            return recent
+
+        key = conversation_key(messages, conversation_id)
+        summary = self.cached_summary(key, older)
+        remaining = older[summary.count:] if summary else older
+        if summarizer is not None and len(remaining) >= max(self.summary_min_messages, 1):
+            self.schedule(key, older, summary, summarizer)
+
+        budget = self.token_budget - sum(count_tokens(message["content"]) for message in recent)
+        compacted = []
+        if summary and (text := truncate(summary.text, budget)):
+            compacted.append({"role": "system", "content": f"Summary of the earlier conversation:\n{text}"})
+            budget -= count_tokens(text)
+
+        truncated = []
+        for message in reversed(remaining):
+            content = truncate(message["content"], min(self.message_tokens, budget))
+            if content is None:
+                break
+            budget -= count_tokens(content)
+            truncated.append({**message, "content": content if content == message["content"] else f"{content} ..."})
+
+        return compacted + truncated[::-1] + recent
+
+    def schedule(self, key: str, older: List[dict], summary: Optional[Summary], summarizer: Summarizer):
+        if key in self._tasks:
+            return
+
+        task = asyncio.create_task(self.summarize(key, older, summary, summarizer))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    async def summarize(self, key: str, older: List[dict], summary: Optional[Summary], summarizer: Summarizer):
+        """
+        Extend the previous summary with the messages it doesn't cover yet
+        """
+        new_messages = older[summary.count:] if summary else older
+        text = "\n".join(f"{message['role']}: {message['content']}" for message in new_messages)
+        if summary:
+            text = f"Summary so far:\n{summary.text}\n\nNew messages:\n{text}"
+
+        try:
+            result = await summarizer(text)
+        except Exception as e:
+            logger.warning(f"Failed to summarize conversation {key}: {e}")
+            return
+        self.cache.set(key, Summary(count=len(older), digest=digest(older), text=result.strip()))
+
+
+history_manager = HistoryManager(
+    recent_messages=settings.HISTORY_RECENT_MESSAGES,
+    token_budget=settings.HISTORY_TOKEN_BUDGET,
+    message_tokens=settings.HISTORY_MESSAGE_TOKENS,
+    summary_min_messages=settings.HISTORY_SUMMARY_MIN_MESSAGES,
+    cache=TTLCache(maxsize=settings.HISTORY_SUMMARY_CACHE_SIZE, ttl=settings.HISTORY_SUMMARY_TTL),
+)
@@ -1,6 +1,6 @@
-from typing import List, Union
+from typing import List, Optional, Union
 from pydantic import BaseModel
-from app.chat.constants import RoleEnum
+from app.chat.constants import ModelEnum, RoleEnum
 
 from app.core.models import TimestampAbstractModel
 
@@ -12,6 +12,8 @@ class BaseMessage(BaseModel):
 
 class Message(BaseModel):
     messages: List[BaseMessage] = []
+    conversation_id: Optional[str] = None
+    model: Optional[ModelEnum] = None  # Defaults to DEFAULT_MODEL
 
 
 class ResponseMessage(TimestampAbstractModel):
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from qdrant_client.fastembed_common import QueryResponse
+
+from app.config import settings
+from app.core.logs import logger
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+
+class Reranker:
+    """
+    Rescores retrieval candidates with a cross-encoder on the CPU.
+    The cost of a (query, document) pair is tracked as a moving average, reranking is skipped whenever
+    the estimate for the candidates exceeds RERANK_LATENCY_BUDGET_MS.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, latency_budget_ms: float):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.latency_budget_ms = latency_budget_ms
+        self.pair_cost_ms: Optional[float] = None
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def estimate_ms(self, pairs: int) -> float:
+        return (self.pair_cost_ms or 0) * pairs
+
+    def warm_up(self):
+        """
+        Load the model and run one batch, so the first request doesn't pay for it
+        """
+        started = time.perf_counter()
+        self.score("warm up", ["warm up"] * self.batch_size)
+        logger.info(f"Reranker {self.model_name} warmed up in {time.perf_counter() - started:.2f}s")
+
+    def score(self, query: str, documents: List[str], deadline: Optional[float] = None) -> Optional[List[float]]:
+        """
+        Score the documents batch by batch, returns None when the `time.monotonic()` deadline passes in between,
+        so an abandoned rerank frees the thread for the next request within one batch
+        """
+        scores = []
+        for start in range(0, len(documents), self.batch_size):
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+            batch = documents[start:start + self.batch_size]
+            started = time.perf_counter()
+            batch_scores = self.model.predict(
+                [(query, document) for document in batch], batch_size=self.batch_size, show_progress_bar=False
+            )
+            scores.extend(batch_scores.tolist())
+
+            cost = (time.perf_counter() - started) * 1000 / len(batch)
+            self.pair_cost_ms = cost if self.pair_cost_ms is None else 0.8 * self.pair_cost_ms + 0.2 * cost
+        return scores
+
+    def rerank(
+        self, query: str, results: List[QueryResponse], top_k: int, deadline: Optional[float] = None
+    ) -> List[QueryResponse]:
+        if len(results) <= 1:
+            return results[:top_k]
+
+        # Time spent waiting for the thread counts against the budget
+        budget_ms = self.latency_budget_ms if deadline is None else (deadline - time.monotonic()) * 1000
+        if self.estimate_ms(len(results)) > budget_ms:
+            logger.warning(
+                f"Skipping rerank, estimated {self.estimate_ms(len(results)):.0f}ms "
+                f"is over the remaining {max(budget_ms, 0):.0f}ms budget"
+            )
+            return results[:top_k]
+
+        scores = self.score(query, [result.document for result in results], deadline)
+        if scores is None:
+            return results[:top_k]
+        ranked = sorted(zip(results, scores), key=lambda item: item[1], reverse=True)[:top_k]
+        return [result.model_copy(update={"score": score}) for result, score in ranked]
+
+    async def arerank(self, query: str, results: List[QueryResponse], top_k: int) -> List[QueryResponse]:
+        """
+        Rerank in a dedicated thread, falls back to the retrieval order when it doesn't finish within the budget.
+        A rerank given up on is dropped from the queue, or stops at its next batch when it's already running.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.latency_budget_ms / 1000
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, self.rerank, query, results, top_k, deadline),
+                timeout=self.latency_budget_ms / 1000,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Rerank didn't finish within {self.latency_budget_ms:.0f}ms, using the retrieval order")
+            return results[:top_k]
+
+
+reranker = Reranker(
+    model_name=settings.RERANK_MODEL,
+    batch_size=settings.RERANK_BATCH_SIZE,
+    latency_budget_ms=settings.RERANK_LATENCY_BUDGET_MS,
+)
@@ -1,45 +1,224 @@
-from typing import List
-from qdrant_client import QdrantClient
+import random
+import threading
+from collections import defaultdict
+from typing import Dict, List
+from qdrant_client import models
 from qdrant_client.fastembed_common import QueryResponse
 
+from app.chat.cache import retrieval_cache
+from app.chat.context import build_context
+from app.chat.embeddings import aembed_query, embed_query, vector_name
 from app.chat.exceptions import RetrievalNoDocumentsFoundException
+from app.chat.rerank import reranker
+from app.chat.sparse import SPARSE_VECTOR_NAME, encode_query
+from app.chat.vector_store import VectorStore, create_vector_store
 from app.config import settings
 from app.core.logs import logger
+from app.core.metrics import CACHE_REQUESTS, timed
 
-client = QdrantClient(url=settings.QDRANT_HOST, api_key=settings.QDRANT_API_KEY)
+_vector_store = None
+_vector_store_lock = threading.Lock()
 
 
-def process_retrieval(query: str) -> str:
+def get_vector_store() -> VectorStore:
+    """
+    Created on first use instead of at import, the API opens it while starting up
+    """
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = create_vector_store()
+    return _vector_store
+
+
+async def close_vector_store():
+    """
+    Close the vector store if it was ever opened, startup may have failed or been cancelled before
+    """
+    global _vector_store
+    if _vector_store is not None:
+        await _vector_store.aclose()
+        _vector_store = None
+
+
+def build_query(query: str, search_results: List[QueryResponse]) -> str:
     """
     Create a query based on the context of the message, clearly linking each piece of context to its source URL or identifier.
     """
-    search_results = search(query=query)
+    with timed("prompt_assembly"):
+        search_contents_with_sources = build_context(
+            search_results,
+            token_budget=settings.CONTEXT_TOKEN_BUDGET,
+            dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD,
+        )
 
-    search_contents_with_sources = []
-    for i, result in enumerate(search_results, start=1):
-        document = result.document.strip()
-        source = result.metadata.get("path", "Unknown source").strip()
-        search_contents_with_sources.append(f"CONTEXT {i}:\n{document}\nSOURCE {i}: {source}\n")
+        search_contents_with_sources_str = "\n".join(search_contents_with_sources)
 
-    search_contents_with_sources_str = "\n".join(search_contents_with_sources)
+        resulting_query: str = (
+            "Answer based only on the context and your general knowledge"
+            f"QUERY:\n{query}\n\n"
+            f"{search_contents_with_sources_str}"
+        )
 
-    resulting_query: str = (
-        "Answer based only on the context and your general knowledge"
-        f"QUERY:\n{query}\n\n"
-        f"{search_contents_with_sources_str}"
-    )
-    logger.info(f"Resulting Query: {resulting_query}")
+    # Prompts are large, only a sample of them is logged and only formatted when it is
+    if random.random() < settings.PROMPT_LOG_SAMPLE_RATE:
+        logger.info("Resulting Query: %s", resulting_query)
     return resulting_query
 
 
+def process_retrieval(query: str) -> str:
+    return build_query(query, search(query=query))
+
+
+async def aprocess_retrieval(query: str) -> str:
+    return build_query(query, await asearch(query=query))
+
+
+def candidates_limit() -> int:
+    """
+    Number of results retrieved before reranking, the reranker keeps RETRIEVAL_LIMIT of them
+    """
+    return settings.RERANK_CANDIDATES if settings.RERANK_ENABLED else settings.RETRIEVAL_LIMIT
+
+
+def search_params() -> models.SearchParams:
+    """
+    HNSW and quantization parameters of the dense search, ignored by collections built without quantization
+    """
+    return models.SearchParams(
+        hnsw_ef=settings.HNSW_EF,
+        quantization=models.QuantizationSearchParams(
+            rescore=settings.QUANTIZATION_RESCORE,
+            oversampling=settings.QUANTIZATION_OVERSAMPLING,
+        ),
+    )
+
+
+def search_requests(query: str, query_vector: List[float]) -> List[models.SearchRequest]:
+    """
+    Dense search request, plus a BM25 sparse one when RETRIEVAL_MODE is hybrid
+    """
+    hybrid = settings.RETRIEVAL_MODE == "hybrid"
+    limit = candidates_limit()
+    requests = [
+        models.SearchRequest(
+            vector=models.NamedVector(name=vector_name(), vector=query_vector),
+            limit=max(settings.HYBRID_CANDIDATES, limit) if hybrid else limit,
+            with_payload=True,
+            params=search_params(),
+        )
+    ]
+
+    sparse_vector = encode_query(query) if hybrid else None
+    if sparse_vector and sparse_vector.indices:
+        requests.append(
+            models.SearchRequest(
+                vector=models.NamedSparseVector(name=SPARSE_VECTOR_NAME, vector=sparse_vector),
+                limit=max(settings.HYBRID_CANDIDATES, limit),
+                with_payload=True,
+            )
+        )
+    return requests
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[models.ScoredPoint]], weights: List[float], k: int, limit: int
+) -> List[models.ScoredPoint]:
+    """
+    Merge ranked lists by summing `weight / (k + rank)` of every point, the fused score replaces the original one
+    """
+    points: Dict[str, models.ScoredPoint] = {}
+    scores: Dict[str, float] = defaultdict(float)
+    for result_list, weight in zip(result_lists, weights):
+        for rank, point in enumerate(result_list, start=1):
+            points.setdefault(str(point.id), point)
+            scores[str(point.id)] += weight / (k + rank)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [points[point_id].model_copy(update={"score": scores[point_id]}) for point_id in ranked]
+
+
+def fuse_results(result_lists: List[List[models.ScoredPoint]]) -> List[models.ScoredPoint]:
+    if len(result_lists) == 1:
+        return result_lists[0][: candidates_limit()]
+
+    return reciprocal_rank_fusion(
+        result_lists,
+        weights=[settings.DENSE_WEIGHT, settings.SPARSE_WEIGHT],
+        k=settings.RRF_K,
+        limit=candidates_limit(),
+    )
+
+
 def search(query: str) -> List[QueryResponse]:
     """
     Search for the most relevant context based on the query
     """
+    if (cached := retrieval_cache.get(query)) is not None:
+        CACHE_REQUESTS.labels("retrieval", "hit").inc()
+        return cached
 
-    search_result = client.query(
-        collection_name=settings.QDRANT_COLLECTION_NAME, limit=3, query_text=query
-    )
-    if not search_result:
+    with timed("embedding"):
+        query_vector = embed_query(query)
+    if (cached := retrieval_cache.get_similar(query, query_vector)) is not None:
+        CACHE_REQUESTS.labels("retrieval", "semantic_hit").inc()
+        return cached
+    CACHE_REQUESTS.labels("retrieval", "miss").inc()
+
+    with timed("search"):
+        result_lists = get_vector_store().search_batch(search_requests(query, query_vector))
+    results = _to_query_responses(fuse_results(result_lists))
+    if settings.RERANK_ENABLED:
+        with timed("rerank"):
+            results = reranker.rerank(query, results, settings.RETRIEVAL_LIMIT)
+    retrieval_cache.set(query, query_vector, results)
+    return results
+
+
+async def asearch(query: str) -> List[QueryResponse]:
+    """
+    Awaitable variant of `search`, embeds the query in a thread pool and searches without blocking the event loop
+    """
+    if (cached := retrieval_cache.get(query)) is not None:
+        CACHE_REQUESTS.labels("retrieval", "hit").inc()
+        return cached
+
+    with timed("embedding"):
+        query_vector = await aembed_query(query)
+    if (cached := retrieval_cache.get_similar(query, query_vector)) is not None:
+        CACHE_REQUESTS.labels("retrieval", "semantic_hit").inc()
+        return cached
+    CACHE_REQUESTS.labels("retrieval", "miss").inc()
+
+    with timed("search"):
+        result_lists = await get_vector_store().asearch_batch(search_requests(query, query_vector))
+    results = _to_query_responses(fuse_results(result_lists))
+    if settings.RERANK_ENABLED:
+        with timed("rerank"):
+            results = await reranker.arerank(query, results, settings.RETRIEVAL_LIMIT)
+    retrieval_cache.set(query, query_vector, results)
+    return results
+
+
+async def warm_up(query: str):
+    """
+    Embed and search a query without the caches, so the first request doesn't pay for loading anything
+    """
+    query_vector = await aembed_query(query)
+    await get_vector_store().asearch_batch(search_requests(query, query_vector))
+
+
+def _to_query_responses(scored_points: List[models.ScoredPoint]) -> List[QueryResponse]:
+    if not scored_points:
         raise RetrievalNoDocumentsFoundException
-    return search_result
+
+    return [
+        QueryResponse(
+            id=point.id,
+            embedding=None,
+            metadata=point.payload,
+            document=point.payload.get("document", ""),
+            score=point.score,
+        )
+        for point in scored_points
+    ]
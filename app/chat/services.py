@@ -1,27 +1,46 @@
-import httpx
-from app.chat.retrieval import process_retrieval
+import asyncio
+import time
+
+from app.chat.backends import LLMRouter, Ticket
+from app.chat.cache import completion_cache
+from app.chat.history import history_manager
+from app.chat.retrieval import aprocess_retrieval
+from app.chat.streaming import sse_stream
 from app.config import settings
-from app.chat.constants import ModelEnum
+from app.core.metrics import (
+    CACHE_REQUESTS,
+    COMPLETIONS,
+    STREAM_SECONDS,
+    TIME_TO_FIRST_TOKEN_SECONDS,
+    TOKENS_PER_SECOND,
+)
 
 from app.chat.models import Message
 
-from openai import AsyncOpenAI, AsyncStream
 
-openai_key = settings.OPENAI_KEY
-if openai_key:
-    client = AsyncOpenAI(api_key=openai_key)
+class CompletionService:
+    def __init__(self, llm_router: LLMRouter):
+        self.llm_router = llm_router
+
+    def model(self, input_message: Message) -> str:
+        return input_message.model.value if input_message.model else self.llm_router.default_model
 
+    async def summarize(self, text: str) -> str:
+        prompt = f"Summarize the conversation below in a few sentences, keep names, codes and numbers.\n\n{text}"
+        return await self.llm_router.generate(prompt, self.llm_router.default_model)
 
-class CompletionService:
-    @staticmethod
-    def get_messages(input_message: Message):
+    async def get_messages(self, input_message: Message):
         latest_message = input_message.messages.pop()
-        enhanced_query = process_retrieval(latest_message.content)
+        enhanced_query = await aprocess_retrieval(latest_message.content)
 
-        messages = [
-            {"role": message.role.value, "content": message.content}
-            for message in input_message.messages
-        ]
+        messages = history_manager.compact(
+            [
+                {"role": message.role.value, "content": message.content}
+                for message in input_message.messages
+            ],
+            conversation_id=input_message.conversation_id,
+            summarizer=self.summarize if settings.HISTORY_SUMMARY_ENABLED else None,
+        )
 
         messages.append(
             {"role": latest_message.role.value, "content": enhanced_query}
@@ -29,27 +48,43 @@ class CompletionService:
 
         return messages
 
-    @classmethod
-    async def with_stream(cls, input_message: Message):
+    async def with_stream(self, input_message: Message, ticket: Ticket):
+        model = self.model(input_message)
+
         async def stream_response():
-            async with httpx.AsyncClient(timeout=300) as client:
-                async with client.stream(
-                    "POST",
-                    f"{settings.OLLAMA_HOST}/api/chat",
-                    json={"model": ModelEnum.MIXTRAL.value, "messages": cls.get_messages(input_message)},
-                ) as response:
-                    async for chunk in response.aiter_bytes():
-                        yield chunk
-
-        async def stream_response_openai():
-            stream: AsyncStream = await client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=cls.get_messages(input_message),
-                stream=True
-            )
-
-            async for event in stream:
-                if current_response := event.choices[0].delta.content:
-                    yield "data: " + current_response + "\n\n"
-
-        return stream_response_openai if openai_key else stream_response
+            started = time.perf_counter()
+            first_token_at = None
+            outcome = "failed"
+            tokens = []
+            try:
+                # Retrieval runs before waiting for a backend slot, the slot is only held while the backend generates
+                messages = await self.get_messages(input_message)
+                if (cached := completion_cache.get(model, messages)) is not None:
+                    CACHE_REQUESTS.labels("completion", "hit").inc()
+                    outcome = "cached"
+                    for token in cached:
+                        yield token
+                    return
+
+                async for token in self.llm_router.stream(messages, model, ticket):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        TIME_TO_FIRST_TOKEN_SECONDS.labels(model).observe(first_token_at - started)
+                    tokens.append(token)
+                    yield token
+                # Only reached when the backend finished the answer
+                outcome = "completed"
+                completion_cache.set(model, messages, tokens)
+            except (asyncio.CancelledError, GeneratorExit):
+                outcome = "cancelled"
+                raise
+            finally:
+                # Not used when the answer was cached or the request failed before reaching a backend
+                ticket.release()
+                finished = time.perf_counter()
+                COMPLETIONS.labels(model, outcome).inc()
+                STREAM_SECONDS.labels(model).observe(finished - started)
+                if first_token_at is not None and len(tokens) > 1 and finished > first_token_at:
+                    TOKENS_PER_SECOND.labels(model).observe((len(tokens) - 1) / (finished - first_token_at))
+
+        return lambda: sse_stream(stream_response())
@@ -0,0 +1,61 @@
+import json
+import math
+import re
+import zlib
+from typing import Dict, List, Optional
+
+from qdrant_client import models
+
+from app.chat.cache import index_version
+from app.config import settings
+
+SPARSE_VECTOR_NAME = "bm25"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+_stats: Optional[dict] = None
+_stats_version: Optional[int] = None
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def token_index(token: str) -> int:
+    """
+    Same hashing as scraper/sparse.py uses for the documents
+    """
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def get_stats() -> dict:
+    """
+    Document frequencies written by the scraper, reloaded whenever the collection is re-indexed
+    """
+    global _stats, _stats_version
+    current_version = index_version()
+    if _stats is None or current_version != _stats_version:
+        try:
+            with open(settings.SPARSE_STATS_FILE, "r") as f:
+                _stats = json.load(f)
+        except FileNotFoundError:
+            _stats = {"documents": 0, "df": {}}
+        _stats_version = current_version
+    return _stats
+
+
+def encode_query(query: str) -> models.SparseVector:
+    """
+    Sparse query vector, every unique token is weighted by its BM25 IDF
+    """
+    stats = get_stats()
+    documents: int = stats["documents"]
+    df: Dict[str, int] = stats["df"]
+
+    indices = list({token_index(token) for token in tokenize(query)})
+    values = []
+    for index in indices:
+        frequency = df.get(str(index), 0)
+        values.append(math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5)) if documents else 1.0)
+
+    return models.SparseVector(indices=indices, values=values)
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import re
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from app.chat.constants import FailureReason
+from app.chat.exceptions import BackendError
+from app.config import settings
+from app.core.logs import logger
+
+
+def ollama_chat_request(model: str, messages: List[dict]) -> dict:
+    return {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "keep_alive": settings.OLLAMA_KEEP_ALIVE,
+        "options": {"num_ctx": settings.OLLAMA_NUM_CTX},
+    }
+
+
+async def ollama_tokens(response: httpx.Response) -> AsyncIterator[str]:
+    """
+    Parse the NDJSON stream of /api/chat line by line, yielding message tokens as soon as they arrive
+    """
+    if response.status_code != 200:
+        await response.aread()
+        raise BackendError(f"Ollama responded with {response.status_code}: {response.text}")
+
+    async for line in response.aiter_lines():
+        if not line.strip():
+            continue
+
+        chunk = json.loads(line)
+        if error := chunk.get("error"):
+            raise BackendError(f"Ollama failed to generate: {error}")
+        if token := chunk.get("message", {}).get("content"):
+            yield token
+        if chunk.get("done"):
+            return
+
+
+def sse_event(token: str, event: Optional[str] = None) -> str:
+    """
+    One `data:` line per line of the token, clients join them back with newlines
+    """
+    lines = "".join("data: " + line + "\n" for line in re.split(r"\r\n|\r|\n", token))
+    if event:
+        return f"event: {event}\n" + lines + "\n"
+    return lines + "\n"
+
+
+async def sse_stream(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Frame tokens of any backend as server-sent events, one event per token. A generation failing midway ends
+    with an `error` event, so the client discards the partial answer instead of keeping it in the history.
+    When the client disconnects the response task is cancelled, closing `tokens` closes the upstream
+    connection, which makes Ollama stop generating.
+    """
+    try:
+        async for token in tokens:
+            yield sse_event(token)
+    except asyncio.CancelledError:
+        logger.info("Client disconnected, cancelling the upstream generation")
+        raise
+    except Exception as e:
+        # Headers are already sent, so the failure can only be reported in the stream
+        if isinstance(e, BackendError):
+            logger.error(f"Completion stream failed: {e}")
+        else:
+            logger.exception("Completion stream failed")
+        yield sse_event(FailureReason.ANSWER_INTERRUPTED.value, event="error")
+    finally:
+        await tokens.aclose()
+
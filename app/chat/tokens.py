@@ -0,0 +1,57 @@
+import os
+import threading
+from typing import Optional
+
+from app.config import settings
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def load_tokenizer():
+    """
+    Load the tokenizer of the chat model from a tokenizer.json path or a Hugging Face repository, downloaded into
+    MODEL_CACHE_DIR. The API loads it as a startup phase, see `app/main.py`, a failure is retried there and keeps
+    /ready failing. Until it's loaded token counts are estimated from the text length.
+    """
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            from tokenizers import Tokenizer
+
+            if os.path.exists(settings.TOKENIZER):
+                path = settings.TOKENIZER
+            else:
+                from huggingface_hub import hf_hub_download
+
+                path = hf_hub_download(
+                    settings.TOKENIZER,
+                    "tokenizer.json",
+                    cache_dir=settings.MODEL_CACHE_DIR,
+                    local_files_only=settings.MODEL_OFFLINE,
+                )
+            _tokenizer = Tokenizer.from_file(path)
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    if _tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(_tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def truncate(text: str, max_tokens: int) -> Optional[str]:
+    """
+    Cut the text to at most `max_tokens` tokens, returns None when nothing fits
+    """
+    if max_tokens <= 0:
+        return None
+
+    tokenizer = _tokenizer
+    if tokenizer is None:
+        return text[: max_tokens * 4] or None
+
+    offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+    if len(offsets) <= max_tokens:
+        return text
+    return text[: offsets[max_tokens - 1][1]] or None
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import mmap
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+from app.chat.cache import index_version
+from app.config import settings
+from app.core.logs import logger
+
+# Same name as scraper/export.py writes
+CURRENT_FILE = "CURRENT"
+
+executor = ThreadPoolExecutor(max_workers=settings.SEARCH_WORKERS, thread_name_prefix="vector-search")
+
+
+class VectorStore(ABC):
+    """
+    Runs the dense and sparse search requests built by `retrieval.search_requests`, one result list per request
+    """
+
+    def load(self):
+        """
+        Open the index before the first search, called when the API starts
+        """
+
+    @abstractmethod
+    def search_batch(self, requests: List[models.SearchRequest]) -> List[List[models.ScoredPoint]]:
+        ...
+
+    async def asearch_batch(self, requests: List[models.SearchRequest]) -> List[List[models.ScoredPoint]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.search_batch, requests)
+
+    async def aclose(self):
+        pass
+
+
+class QdrantStore(VectorStore):
+    """
+    Qdrant server, every search is a request to QDRANT_HOST
+    """
+
+    def __init__(self, url: str, api_key: Optional[str]):
+        self.client = QdrantClient(url=url, api_key=api_key)
+        self.async_client = AsyncQdrantClient(url=url, api_key=api_key)
+
+    def search_batch(self, requests):
+        return self.client.search_batch(collection_name=settings.QDRANT_COLLECTION_NAME, requests=requests)
+
+    async def asearch_batch(self, requests):
+        return await self.async_client.search_batch(
+            collection_name=settings.QDRANT_COLLECTION_NAME, requests=requests
+        )
+
+    async def aclose(self):
+        await self.async_client.close()
+        self.client.close()
+
+
+class LocalQdrantStore(VectorStore):
+    """
+    Qdrant in local mode, searching the collection files in QDRANT_PATH in process.
+    The directory is locked by a single client, so it only works with one uvicorn worker and while the scraper
+    isn't writing to it.
+    """
+
+    def __init__(self, path: str):
+        self.client = QdrantClient(path=path)
+        self._lock = threading.Lock()  # The local client isn't meant to be used from several threads
+
+    def search_batch(self, requests):
+        with self._lock:
+            return self.client.search_batch(collection_name=settings.QDRANT_COLLECTION_NAME, requests=requests)
+
+    async def aclose(self):
+        self.client.close()
+
+
+@dataclass
+class NumpyIndex:
+    """
+    Index files written by scraper/export.py, memory-mapped so uvicorn workers share them through the page cache
+    """
+
+    vector_name: str
+    vectors: np.ndarray  # Normalized, grouped by IVF list when there are lists
+    payloads: Optional[mmap.mmap]  # JSON lines of [id, payload]
+    payload_offsets: np.ndarray
+    centroids: Optional[np.ndarray] = None
+    list_offsets: Optional[np.ndarray] = None
+    sparse_terms: Optional[np.ndarray] = None  # Sorted, with the postings of a term at sparse_offsets[i]:[i + 1]
+    sparse_offsets: Optional[np.ndarray] = None
+    sparse_rows: Optional[np.ndarray] = None
+    sparse_values: Optional[np.ndarray] = None
+
+    @classmethod
+    def open(cls, directory: str) -> "NumpyIndex":
+        try:
+            with open(os.path.join(directory, CURRENT_FILE), "r") as f:
+                path = os.path.join(directory, f.read().strip())
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No NumPy index in {directory}, export one with `python -m scraper.insert_data --export-numpy`"
+            )
+
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+
+        def load(name: str) -> Optional[np.ndarray]:
+            if not os.path.exists(os.path.join(path, name)):
+                return None
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        payloads = None
+        if meta["count"]:
+            with open(os.path.join(path, "payloads.jsonl"), "rb") as f:
+                payloads = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        logger.info(f"Loaded NumPy index {path}: {meta['count']} points, {meta['lists'] or 'no'} IVF lists")
+        return cls(
+            vector_name=meta["vector_name"],
+            vectors=load("vectors.npy"),
+            payloads=payloads,
+            payload_offsets=load("payload_offsets.npy"),
+            centroids=load("centroids.npy"),
+            list_offsets=load("list_offsets.npy"),
+            sparse_terms=load("sparse_terms.npy"),
+            sparse_offsets=load("sparse_offsets.npy"),
+            sparse_rows=load("sparse_rows.npy"),
+            sparse_values=load("sparse_values.npy"),
+        )
+
+    def payload(self, row: int) -> list:
+        return json.loads(self.payloads[self.payload_offsets[row]:self.payload_offsets[row + 1]])
+
+    def candidate_rows(self, query: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        """
+        Rows of the `nprobe` IVF lists closest to the query, None searches every row
+        """
+        if self.centroids is None or nprobe >= len(self.centroids):
+            return None
+
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists])
+
+    def dense_scores(self, vector: List[float], nprobe: int):
+        query = np.array(vector, dtype=np.float32)
+        query /= max(np.linalg.norm(query), 1e-12)
+
+        rows = self.candidate_rows(query, nprobe)
+        if rows is None:
+            return np.arange(len(self.vectors)), self.vectors @ query
+        return rows, self.vectors[rows] @ query
+
+    def sparse_scores(self, vector: models.SparseVector):
+        scores = np.zeros(len(self.vectors), dtype=np.float32)
+        if self.sparse_terms is None:
+            return np.arange(0), scores[:0]
+
+        positions = np.searchsorted(self.sparse_terms, vector.indices)
+        for position, index, value in zip(positions, vector.indices, vector.values):
+            if position < len(self.sparse_terms) and self.sparse_terms[position] == index:
+                start, end = self.sparse_offsets[position], self.sparse_offsets[position + 1]
+                # A term appears once in a point, so the rows of its postings are unique
+                scores[self.sparse_rows[start:end]] += value * self.sparse_values[start:end]
+
+        rows = np.flatnonzero(scores)
+        return rows, scores[rows]
+
+    def search(self, request: models.SearchRequest, nprobe: int) -> List[models.ScoredPoint]:
+        if request.filter is not None:
+            raise ValueError("Filters aren't supported by the NumPy vector store")
+
+        if isinstance(request.vector, models.NamedSparseVector):
+            rows, scores = self.sparse_scores(request.vector.vector)
+        else:
+            if isinstance(request.vector, models.NamedVector) and request.vector.name != self.vector_name:
+                raise ValueError(f"NumPy index holds {self.vector_name} vectors, got a {request.vector.name} query")
+            vector = request.vector.vector if isinstance(request.vector, models.NamedVector) else request.vector
+            rows, scores = self.dense_scores(vector, nprobe)
+
+        if request.score_threshold is not None:
+            keep = scores >= request.score_threshold
+            rows, scores = rows[keep], scores[keep]
+
+        limit = min(request.limit + (request.offset or 0), len(scores))
+        if limit == 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])][request.offset or 0:]
+
+        results = []
+        for i in top:
+            point_id, payload = self.payload(rows[i])
+            results.append(
+                models.ScoredPoint(
+                    id=point_id,
+                    version=0,
+                    score=float(scores[i]),
+                    payload=payload if request.with_payload else None,
+                )
+            )
+        return results
+
+
+class NumpyStore(VectorStore):
+    """
+    Flat or IVF index exported by the scraper into NUMPY_INDEX_DIRECTORY, searched by brute force with NumPy.
+    A new export is picked up when the index version changes.
+    """
+
+    def __init__(self, directory: str, nprobe: int):
+        self.directory = directory
+        self.nprobe = nprobe
+        self._index: Optional[NumpyIndex] = None
+        self._index_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self) -> NumpyIndex:
+        current_version = index_version()
+        if self._index is None or current_version != self._index_version:
+            with self._lock:
+                if self._index is None or current_version != self._index_version:
+                    self._index = NumpyIndex.open(self.directory)
+                    self._index_version = current_version
+        return self._index
+
+    def load(self):
+        self.index
+
+    def search_batch(self, requests):
+        index = self.index
+        return [index.search(request, self.nprobe) for request in requests]
+
+
+def create_vector_store() -> VectorStore:
+    if settings.VECTOR_STORE == "qdrant":
+        return QdrantStore(settings.QDRANT_HOST, settings.QDRANT_API_KEY)
+    if settings.VECTOR_STORE == "qdrant_local":
+        return LocalQdrantStore(settings.QDRANT_PATH)
+    if settings.VECTOR_STORE == "numpy":
+        return NumpyStore(settings.NUMPY_INDEX_DIRECTORY, settings.IVF_NPROBE)
+    raise ValueError(f"Unknown VECTOR_STORE: {settings.VECTOR_STORE}, expected qdrant, qdrant_local or numpy")
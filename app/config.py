@@ -9,16 +9,98 @@ from app.core.constants import Environment
 class Settings(BaseSettings):
     APP_NAME: str = "PJA-RAG"
     ENVIRONMENT: str = Field(default=Environment.LOCAL.value)
+    LOG_LEVEL: str = "INFO"
+    PROMPT_LOG_SAMPLE_RATE: float = 0.01  # Share of the prompts logged in full
     OLLAMA_HOST: str = "http://ollama:11434"
+    OLLAMA_HOSTS: list[str] = []  # Ollama nodes to balance between, OLLAMA_HOST is used when empty
+    OPENAI_MODELS: list[str] = ["gpt-3.5-turbo", "gpt-4"]  # Served by OpenAI when OPENAI_KEY is set
+    DEFAULT_OLLAMA_MODEL: str = "mixtral"
+    DEFAULT_MODEL: Optional[str] = None  # The first OpenAI model when OPENAI_KEY is set, otherwise DEFAULT_OLLAMA_MODEL
+    HEALTH_CHECK_INTERVAL: float = 10
+    HEALTH_CHECK_TIMEOUT: float = 5
+    EJECT_AFTER_FAILURES: int = 3  # Consecutive failures before a backend stops getting requests
+    EJECT_SECONDS: int = 30
+    OLLAMA_KEEP_ALIVE: str = "30m"  # How long Ollama keeps the model loaded after a request
+    OLLAMA_NUM_CTX: int = 4096
+    OLLAMA_PRELOAD: bool = True  # Load the model when the API starts
+    OLLAMA_MAX_CONCURRENCY: int = 2  # Generations run at once on every node, match OLLAMA_NUM_PARALLEL
+    OPENAI_MAX_CONCURRENCY: int = 20
+    MAX_QUEUE_DEPTH: int = 32  # Requests waiting for a backend, the next ones get a 503
+    ADMISSION_RESERVATION_TTL: float = 60  # Seconds an admitted request keeps its place before it asks for a slot
+    RATE_LIMIT_REQUESTS: int = 20  # Completions per minute per client, 0 disables the limit
+    RATE_LIMIT_BURST: int = 5
+    RATE_LIMIT_TRUST_FORWARDED: bool = False  # Identify clients by X-Forwarded-For, only behind a trusted proxy
 
     QDRANT_HOST: str = "http://qdrant:6333"
     QDRANT_API_KEY: Optional[str] = None
     QDRANT_COLLECTION_NAME: str = "documents"
+    VECTOR_STORE: str = "qdrant"  # qdrant (server at QDRANT_HOST), qdrant_local (QDRANT_PATH) or numpy
+    QDRANT_PATH: str = "cache/qdrant"  # Local mode storage, locked by a single process
+    NUMPY_INDEX_DIRECTORY: str = "cache/vector_index"  # Written by `python -m scraper.insert_data --export-numpy`
+    IVF_NPROBE: int = 8  # IVF lists searched per query by the numpy store, more is better recall and slower
+    SEARCH_WORKERS: int = 4  # Threads running in-process searches of the qdrant_local and numpy stores
 
-    DATA_DIRECTORY: str = "data/"
+    EMBEDDING_BACKEND: str = "fastembed"  # fastembed, sentence_transformers or openai, same as the scraper
+    EMBEDDING_MODEL: str = "BAAI/bge-small-en"
+    EMBEDDING_WORKERS: int = 4  # Size of the thread pool used to embed queries
+    EMBEDDING_QUANTIZED: bool = False  # Embed queries with an int8 quantized copy of the ONNX model
+    MODEL_CACHE_DIR: str = "cache/models"  # fastembed models, filled by `python -m app.chat.embeddings`
+    MODEL_OFFLINE: bool = False  # Only load cached models, never reach Hugging Face
+    WARM_UP_QUERY: str = "warm up"  # Embedded and searched while starting up, an empty string skips it
+    STARTUP_RETRY_SECONDS: float = 5  # Delay before a failed startup phase is retried, doubled on every failure
+    STARTUP_RETRY_MAX_SECONDS: float = 300
+
+    RETRIEVAL_MODE: str = "dense"  # dense or hybrid (dense + BM25 merged with reciprocal rank fusion)
+    RETRIEVAL_LIMIT: int = 3
+    HYBRID_CANDIDATES: int = 20  # Hits fetched from each of the dense and sparse searches before fusion
+    RRF_K: int = 60
+    DENSE_WEIGHT: float = 1.0
+    SPARSE_WEIGHT: float = 1.0
+    SPARSE_STATS_FILE: str = "data/.sparse_stats.json"
+    HNSW_EF: int = 128  # Candidates explored by the HNSW search, more is better recall and slower
+    QUANTIZATION_RESCORE: bool = True  # Rescore quantized hits with the original vectors
+    QUANTIZATION_OVERSAMPLING: float = 2.0  # Quantized hits fetched per result before rescoring
+
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 30  # Hits fetched for the cross-encoder, the best RETRIEVAL_LIMIT of them are kept
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_LATENCY_BUDGET_MS: float = 300  # Reranking is skipped when it's expected to take longer
+
+    CONTEXT_TOKEN_BUDGET: int = 2048  # Maximal number of context tokens added to the prompt
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8  # Share of word shingles two chunks have in common to count as duplicates
+    # Hugging Face repository or path to a tokenizer.json, the default is an ungated copy of the Mixtral tokenizer
+    TOKENIZER: str = "TheBloke/Mixtral-8x7B-v0.1-GPTQ"
+
+    HISTORY_RECENT_MESSAGES: int = 4  # Latest messages always sent verbatim
+    HISTORY_TOKEN_BUDGET: int = 1024  # Tokens of history sent with every request
+    HISTORY_MESSAGE_TOKENS: int = 256  # Older messages are truncated to this many tokens until they are summarized
+    HISTORY_SUMMARY_ENABLED: bool = False  # Summaries are generated by the chat backends, competing with answers
+    HISTORY_SUMMARY_MIN_MESSAGES: int = 4  # Messages not covered by the summary before it is extended
+    HISTORY_SUMMARY_CACHE_SIZE: int = 1024
+    HISTORY_SUMMARY_TTL: int = 24 * 3600
+
+    RETRIEVAL_CACHE_SIZE: int = 1024  # 0 disables the exact query cache
+    RETRIEVAL_CACHE_TTL: int = 3600
+    SEMANTIC_CACHE_SIZE: int = 256  # 0 disables the semantic cache
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # Minimal cosine similarity to reuse cached results
+    COMPLETION_CACHE_ENABLED: bool = False
+    COMPLETION_CACHE_BACKEND: str = "memory"  # memory or disk
+    COMPLETION_CACHE_SIZE: int = 512
+    COMPLETION_CACHE_TTL: int = 3600
+    COMPLETION_CACHE_FILE: str = "cache/completion_cache.db"
+    INDEX_VERSION_FILE: str = "data/.index_version"  # Touched by scraper/insert_data.py after indexing
+
+    DATA_DIRECTORY: str = "data/"  # Every file in it is indexed, caches and indexes live in cache/
 
     OPENAI_KEY: typing.Optional[str] = None
 
+    HTTP_TIMEOUT: float = 300
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30  # Seconds an idle connection is kept in the pool
+    HTTP2: bool = True
+
     ALLOWED_HOSTS: list[str] = ["*"]
 
     @property
@@ -1,7 +1,9 @@
 from fastapi import APIRouter
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from starlette import status
 from starlette.requests import Request
+from starlette.responses import Response
 
 
 router = APIRouter(tags=["Core"])
@@ -10,3 +12,16 @@ router = APIRouter(tags=["Core"])
 @router.get("/health", status_code=status.HTTP_200_OK)
 async def health(request: Request):
     return {"status": "ok", "version": request.app.version}
+
+
+@router.get("/ready", status_code=status.HTTP_200_OK)
+async def ready(request: Request, response: Response):
+    readiness = request.app.state.readiness
+    if not readiness.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"ready": readiness.ready, "phases": readiness.phases}
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,6 +1,8 @@
 import logging
 
-logging.basicConfig(level=logging.INFO)
+from app.config import settings
+
+logging.basicConfig(level=settings.LOG_LEVEL)
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,55 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds",
+    "Duration of the stages of a chat turn",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "rag_time_to_first_token_seconds",
+    "Time from the start of a completion to its first token, retrieval included",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+STREAM_SECONDS = Histogram(
+    "rag_stream_duration_seconds",
+    "Total duration of a completion stream",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+TOKENS_PER_SECOND = Histogram(
+    "rag_tokens_per_second",
+    "Generation speed after the first token",
+    ["model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200),
+)
+COMPLETIONS = Counter(
+    "rag_completions_total",
+    "Completion streams by outcome: completed, cached, failed or cancelled",
+    ["model", "outcome"],
+)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total",
+    "Cache lookups",
+    ["cache", "result"],
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "rag_startup_phase_duration_seconds",
+    "Duration of the startup phases run before the API reports ready",
+    ["phase"],
+)
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
@@ -0,0 +1,57 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from app.core.logs import logger
+from app.core.metrics import STARTUP_PHASE_SECONDS
+
+
+class Readiness:
+    """
+    Startup phases run in order after the server is up, /ready answers 503 until all of them succeeded.
+    A failed phase is retried with exponential backoff, the phases after it are skipped until it succeeds.
+    /health only tells the process is alive.
+    """
+
+    def __init__(self, retry_seconds: float, max_retry_seconds: float):
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.phases: Dict[str, dict] = {}
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.phases) and all(phase["status"] == "done" for phase in self.phases.values())
+
+    @property
+    def finished(self) -> bool:
+        """
+        No phase is left to run, either all succeeded or one failed and is being retried
+        """
+        return bool(self.phases) and all(phase["status"] != "pending" for phase in self.phases.values())
+
+    async def run(self, phases: List[Tuple[str, Callable[[], Awaitable]]]):
+        for name, _ in phases:
+            self.phases[name] = {"status": "pending"}
+
+        for index, (name, phase) in enumerate(phases):
+            attempts = 0
+            while True:
+                attempts += 1
+                started = time.perf_counter()
+                try:
+                    await phase()
+                    break
+                except Exception as e:
+                    delay = min(self.retry_seconds * 2 ** (attempts - 1), self.max_retry_seconds)
+                    logger.exception(f"Startup phase {name} failed, retrying in {delay:.0f}s")
+                    self.phases[name] = {"status": "failed", "error": str(e), "attempts": attempts}
+                    for skipped, _ in phases[index + 1:]:
+                        self.phases[skipped] = {"status": "skipped"}
+                    await asyncio.sleep(delay)
+
+            elapsed = time.perf_counter() - started
+            STARTUP_PHASE_SECONDS.labels(name).set(elapsed)
+            self.phases[name] = {"status": "done", "seconds": round(elapsed, 3), "attempts": attempts}
+            for later, _ in phases[index + 1:]:
+                self.phases[later] = {"status": "pending"}
+            logger.info(f"Startup phase {name} done in {elapsed:.2f}s")
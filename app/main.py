@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -5,15 +6,59 @@ from contextlib import asynccontextmanager
 
 from app.core.api import router as core_router
 from app.chat.api import router as chat_router
+from app.chat.backends import create_router
+from app.chat.clients import create_http_client, create_openai_client
+from app.chat.embeddings import executor as embedding_executor, get_model
+from app.chat.rerank import executor as rerank_executor, reranker
+from app.chat.retrieval import close_vector_store, get_vector_store, warm_up
+from app.chat.tokens import load_tokenizer
+from app.chat.vector_store import executor as vector_search_executor
 from app.core.logs import logger
+from app.core.readiness import Readiness
 from app.config import settings
 
 
+def load_vector_store():
+    # Opening a local mode Qdrant reads the whole collection, so this runs in a thread as well
+    get_vector_store().load()
+
+
+def startup_phases() -> list:
+    """
+    Load everything the first request would otherwise wait for, in the thread pools that use it later
+    """
+    loop = asyncio.get_running_loop()
+    phases = [
+        ("vector_store", lambda: loop.run_in_executor(vector_search_executor, load_vector_store)),
+        ("embedding_model", lambda: loop.run_in_executor(embedding_executor, get_model)),
+        ("tokenizer", lambda: loop.run_in_executor(None, load_tokenizer)),
+    ]
+    if settings.RERANK_ENABLED:
+        phases.append(("rerank_model", lambda: loop.run_in_executor(rerank_executor, reranker.warm_up)))
+    if settings.WARM_UP_QUERY:
+        phases.append(("warm_up_query", lambda: warm_up(settings.WARM_UP_QUERY)))
+    return phases
+
+
 @asynccontextmanager
-async def lifespan(app: str):
+async def lifespan(app: FastAPI):
     logger.info("Starting up the server")
+    app.state.http_client = create_http_client()
+    app.state.openai_client = create_openai_client(app.state.http_client)
+    app.state.llm_router = create_router(app.state.http_client, app.state.openai_client)
+    background_tasks = [asyncio.create_task(app.state.llm_router.run_health_checks())]
+    if settings.OLLAMA_PRELOAD:
+        # In the background, loading Mixtral can take minutes and the API should be up meanwhile
+        background_tasks.append(asyncio.create_task(app.state.llm_router.preload(app.state.llm_router.default_model)))
+    app.state.readiness = Readiness(settings.STARTUP_RETRY_SECONDS, settings.STARTUP_RETRY_MAX_SECONDS)
+    background_tasks.append(asyncio.create_task(app.state.readiness.run(startup_phases())))
     yield
     logger.info("Shutting down the server")
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await app.state.http_client.aclose()
+    await close_vector_store()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -23,6 +68,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Queue-Position", "Retry-After"],
 )
 
 app.include_router(core_router)
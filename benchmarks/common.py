@@ -0,0 +1,37 @@
+import resource
+import statistics
+import subprocess
+from typing import List
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(latencies_ms: List[float]) -> dict:
+    if not latencies_ms:
+        return {}
+    return {
+        "count": len(latencies_ms),
+        "mean": statistics.mean(latencies_ms),
+        "p50": percentile(latencies_ms, 0.5),
+        "p95": percentile(latencies_ms, 0.95),
+        "p99": percentile(latencies_ms, 0.99),
+        "max": max(latencies_ms),
+    }
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
@@ -0,0 +1,87 @@
+"""
+Stand-in for the Ollama API streaming canned tokens, so the chat pipeline can be benchmarked without a GPU.
+Prefill time grows with the prompt length, like it does for a real model.
+
+    python -m benchmarks.mock_ollama --port 11434 --tokens 64 --token-delay 0.02
+"""
+import argparse
+import asyncio
+import json
+from dataclasses import dataclass
+
+from aiohttp import web
+
+
+@dataclass
+class MockOllamaConfig:
+    tokens: int = 64
+    token_delay: float = 0.01  # Seconds between tokens
+    prefill_delay: float = 0.05  # Seconds before the first token
+    prefill_per_1k_chars: float = 0.02  # Extra prefill seconds per 1000 characters of prompt
+
+
+def create_app(config: MockOllamaConfig) -> web.Application:
+    async def prefill(prompt_length: int):
+        await asyncio.sleep(config.prefill_delay + config.prefill_per_1k_chars * prompt_length / 1000)
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "mixtral")
+        await prefill(sum(len(message.get("content", "")) for message in body.get("messages", [])))
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for i in range(config.tokens):
+            chunk = {"model": model, "message": {"role": "assistant", "content": f"token{i} "}, "done": False}
+            await response.write((json.dumps(chunk) + "\n").encode())
+            await asyncio.sleep(config.token_delay)
+        await response.write((json.dumps({"model": model, "done": True, "eval_count": config.tokens}) + "\n").encode())
+        return response
+
+    async def generate(request: web.Request) -> web.Response:
+        body = await request.json()
+        if body.get("prompt"):
+            await prefill(len(body["prompt"]))
+            await asyncio.sleep(config.token_delay * config.tokens)
+        return web.json_response({"model": body.get("model"), "response": "Summary.", "done": True})
+
+    async def tags(request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": "mixtral:latest"}, {"name": "mistral:latest"}]})
+
+    app = web.Application()
+    app.router.add_post("/api/chat", chat)
+    app.router.add_post("/api/generate", generate)
+    app.router.add_get("/api/tags", tags)
+    return app
+
+
+async def start(config: MockOllamaConfig, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+    """
+    Start the server in the running event loop, port 0 picks a free port (see `bound_url`)
+    """
+    runner = web.AppRunner(create_app(config), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def bound_url(runner: web.AppRunner) -> str:
+    host, port = runner.addresses[0][:2]
+    return f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Mock Ollama server streaming canned tokens")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=11434)
+    arg_parser.add_argument("--tokens", type=int, default=MockOllamaConfig.tokens)
+    arg_parser.add_argument("--token-delay", type=float, default=MockOllamaConfig.token_delay)
+    arg_parser.add_argument("--prefill-delay", type=float, default=MockOllamaConfig.prefill_delay)
+    arg_parser.add_argument("--prefill-per-1k-chars", type=float, default=MockOllamaConfig.prefill_per_1k_chars)
+    args = arg_parser.parse_args()
+
+    web.run_app(
+        create_app(MockOllamaConfig(args.tokens, args.token_delay, args.prefill_delay, args.prefill_per_1k_chars)),
+        host=args.host,
+        port=args.port,
+    )
@@ -0,0 +1,74 @@
+"""
+Compare recall and latency of dense-only and hybrid retrieval against the live collection.
+
+Queries are read from a JSON lines file, every line is `{"query": ..., "expected": [paths or filenames]}`.
+A query counts as recalled when any of the expected sources is in the top RETRIEVAL_LIMIT results.
+
+    python -m benchmarks.retrieval queries.jsonl --output retrieval.json
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import List
+
+from benchmarks.common import percentile
+
+from app.chat import retrieval
+from app.chat.cache import retrieval_cache
+from app.chat.exceptions import RetrievalNoDocumentsFoundException
+from app.config import settings
+
+
+def is_hit(results, expected: List[str]) -> bool:
+    sources = {value for result in results for value in (result.metadata.get("path"), result.metadata.get("filename"))}
+    return any(source in sources for source in expected)
+
+
+def run(queries: List[dict], mode: str, repeat: int) -> dict:
+    settings.RETRIEVAL_MODE = mode
+    latencies, hits = [], 0
+
+    for item in queries:
+        for attempt in range(repeat):
+            retrieval_cache.clear()
+            started = time.perf_counter()
+            try:
+                results = retrieval.search(item["query"])
+            except RetrievalNoDocumentsFoundException:
+                results = []
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        hits += is_hit(results, item["expected"])
+
+    return {
+        "mode": mode,
+        "queries": len(queries),
+        f"recall@{settings.RETRIEVAL_LIMIT}": hits / len(queries),
+        "latency_ms": {
+            "mean": statistics.mean(latencies),
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+        },
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark dense-only against hybrid retrieval")
+    arg_parser.add_argument("queries", help="JSON lines file with queries and their expected sources")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="Searches per query, for stable latencies")
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    args = arg_parser.parse_args()
+
+    with open(args.queries, "r") as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+
+    # Warm up the embedding model and the connection, so the first mode isn't penalized
+    retrieval.search(queries[0]["query"])
+
+    report = [run(queries, mode, args.repeat) for mode in ("dense", "hybrid")]
+    print(json.dumps(report, indent=4))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
@@ -0,0 +1,301 @@
+"""
+Offline benchmark of the whole pipeline: ingestion into a local-mode Qdrant, retrieval, and completions
+streamed through the API from a mock Ollama server.
+
+Requests are read from a JSON lines file, every line is either `{"query": ...}` or a full completion
+body `{"messages": [...]}`. Results are printed and optionally written as JSON, to compare runs across commits.
+
+    python -m benchmarks.suite --requests benchmarks/requests.jsonl --concurrency 8 --output benchmark.json
+
+`--vector-store numpy` also exports the collection and searches the memory-mapped NumPy index instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+
+def configure_environment(workdir: str, data_directory: str, use_cache: bool, vector_store: str):
+    """
+    Point the API and the scraper at throwaway files, must run before `app` or `scraper` modules are imported
+    """
+    os.environ.update({
+        "QDRANT_COLLECTION_NAME": "benchmark",
+        "VECTOR_STORE": vector_store,
+        "QDRANT_PATH": os.path.join(workdir, "qdrant"),
+        "NUMPY_INDEX_DIRECTORY": os.path.join(workdir, "vector_index"),
+        "DATA_DIRECTORY": data_directory,
+        "MANIFEST_FILE": os.path.join(workdir, "manifest.jsonl"),
+        "SPARSE_STATS_FILE": os.path.join(workdir, "sparse_stats.json"),
+        "INDEX_VERSION_FILE": os.path.join(workdir, "index_version"),
+        "URL_HASH_MAPPING_FILE": os.path.join(workdir, "url_hash_mapping.db"),
+        "OPENAI_KEY": "",
+        "OLLAMA_PRELOAD": "false",
+        "RATE_LIMIT_REQUESTS": "0",
+        "MAX_QUEUE_DEPTH": "100000",
+        "COMPLETION_CACHE_ENABLED": "false",
+        "HISTORY_SUMMARY_ENABLED": "false",
+        "PROMPT_LOG_SAMPLE_RATE": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    if not use_cache:
+        os.environ.update({"RETRIEVAL_CACHE_SIZE": "0", "SEMANTIC_CACHE_SIZE": "0"})
+
+
+def generate_documents(directory: str, count: int, seed: int = 0):
+    """
+    Synthetic corpus of lecture notes, used when no data directory is given
+    """
+    rng = random.Random(seed)
+    words = (
+        "lecture exam course student project database network algorithm semester room grade "
+        "professor assignment deadline lab schedule credit thesis seminar software system"
+    ).split()
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + "."
+            for _ in range(rng.randint(10, 60))
+        ]
+        sentences.insert(rng.randrange(len(sentences)), f"Course ABC{i:03d} takes place in room A{i % 50:02d}.")
+        with open(os.path.join(directory, f"notes_{i:04d}.txt"), "w") as f:
+            f.write(" ".join(sentences))
+
+
+def load_requests(path: str) -> List[dict]:
+    with open(path, "r") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    return [
+        item if "messages" in item else {"messages": [{"role": "user", "content": item["query"]}]}
+        for item in items
+    ]
+
+
+def benchmark_import() -> dict:
+    """
+    Import time of the API in a fresh interpreter, models and clients are only loaded once it starts
+    """
+    code = "import time; started = time.perf_counter(); import app.main; print(time.perf_counter() - started)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return {"seconds": float(output.stdout.split()[-1])}
+
+
+def benchmark_ingestion(qdrant_path: str, data_directory: str, export_numpy: bool) -> dict:
+    from qdrant_client import QdrantClient
+
+    from benchmarks.common import peak_rss_mb
+    from scraper import config, export, insert_data
+
+    files = sum(1 for _ in insert_data.walk_files(data_directory))
+    client = QdrantClient(path=qdrant_path)
+    started = time.perf_counter()
+    insert_data.rebuild(client)
+    elapsed = time.perf_counter() - started
+    points = client.count(os.environ["QDRANT_COLLECTION_NAME"]).count
+
+    report = {
+        "files": files,
+        "points": points,
+        "seconds": elapsed,
+        "docs_per_second": files / elapsed,
+        "points_per_second": points / elapsed,
+    }
+    if export_numpy:
+        started = time.perf_counter()
+        export.export_numpy(
+            client, config.QDRANT_COLLECTION_NAME, config.NUMPY_INDEX_DIRECTORY, config.NUMPY_IVF_LISTS
+        )
+        report["export_seconds"] = time.perf_counter() - started
+
+    client.close()
+    insert_data.bump_index_version()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+async def benchmark_retrieval(queries: List[str], concurrency: int) -> dict:
+    from benchmarks.common import summarize
+    from app.chat import retrieval
+    from app.chat.exceptions import RetrievalNoDocumentsFoundException
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def run(query: str):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await retrieval.asearch(query)
+            except RetrievalNoDocumentsFoundException:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    # Warm up the embedding model, so loading it isn't measured
+    await run(queries[0])
+    latencies.clear()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(query) for query in queries))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(queries),
+        "errors": errors,
+        "throughput_rps": len(queries) / elapsed,
+        "latency_ms": summarize(latencies),
+    }
+
+
+async def benchmark_completions(api_url: str, bodies: List[dict], concurrency: int) -> dict:
+    import httpx
+
+    from benchmarks.common import summarize
+
+    semaphore = asyncio.Semaphore(concurrency)
+    ttft, totals, token_rates = [], [], []
+    errors = 0
+
+    async def run(client: httpx.AsyncClient, body: dict):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            first_token_at = None
+            tokens = 0
+            buffer = ""
+            try:
+                async with client.stream("POST", f"{api_url}/v1/completion", json=body) as response:
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                    async for chunk in response.aiter_text():
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        # One event per token, a blank line ends it
+                        buffer += chunk
+                        tokens += buffer.count("\n\n")
+                        buffer = buffer.rsplit("\n\n", 1)[-1]
+            except httpx.HTTPError:
+                errors += 1
+                return
+            finished = time.perf_counter()
+
+            if first_token_at is None:
+                errors += 1
+                return
+            ttft.append((first_token_at - started) * 1000)
+            totals.append((finished - started) * 1000)
+            if finished > first_token_at:
+                token_rates.append(tokens / (finished - first_token_at))
+
+    async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=concurrency)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(run(client, body) for body in bodies))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(bodies),
+        "errors": errors,
+        "throughput_rps": (len(bodies) - errors) / elapsed,
+        "time_to_first_token_ms": summarize(ttft),
+        "total_ms": summarize(totals),
+        "tokens_per_second": summarize(token_rates),
+    }
+
+
+async def benchmark_api(args, bodies: List[dict]) -> dict:
+    import uvicorn
+
+    from benchmarks.mock_ollama import MockOllamaConfig, bound_url, start
+    from app.chat import retrieval
+    from app.config import settings
+
+    mock = await start(MockOllamaConfig(args.tokens, args.token_delay, args.prefill_delay))
+    settings.OLLAMA_HOST = bound_url(mock)
+    settings.OLLAMA_HOSTS = []
+
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    try:
+        while not server.started:
+            await asyncio.sleep(0.05)
+        # Requests are measured against a warm API, the startup phases load the models first
+        deadline = time.perf_counter() + 300
+        while time.perf_counter() < deadline and not app.state.readiness.finished:
+            await asyncio.sleep(0.05)
+
+        queries = [body["messages"][-1]["content"] for body in bodies]
+        return {
+            "startup": app.state.readiness.phases,
+            "retrieval": await benchmark_retrieval(queries, args.concurrency),
+            "completion": await benchmark_completions(f"http://127.0.0.1:{args.port}", bodies, args.concurrency),
+        }
+    finally:
+        server.should_exit = True
+        await serving
+        await mock.cleanup()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Offline benchmark of ingestion, retrieval and completions")
+    arg_parser.add_argument("--requests", default="benchmarks/requests.jsonl", help="JSON lines request set")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Times the request set is replayed")
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    arg_parser.add_argument("--data", help="Directory to index, a synthetic corpus is generated when not given")
+    arg_parser.add_argument("--documents", type=int, default=200, help="Size of the synthetic corpus")
+    arg_parser.add_argument("--tokens", type=int, default=64, help="Tokens streamed by the mock Ollama")
+    arg_parser.add_argument("--token-delay", type=float, default=0.01)
+    arg_parser.add_argument("--prefill-delay", type=float, default=0.05)
+    arg_parser.add_argument("--port", type=int, default=18080, help="Port of the benchmarked API")
+    arg_parser.add_argument("--cache", action="store_true", help="Keep the retrieval caches enabled")
+    arg_parser.add_argument("--vector-store", choices=["qdrant_local", "numpy"], default="qdrant_local")
+    arg_parser.add_argument("--output", help="Write the results to this JSON file")
+    args = arg_parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    try:
+        data_directory = args.data or os.path.join(workdir, "data")
+        if not args.data:
+            generate_documents(data_directory, args.documents)
+        configure_environment(workdir, data_directory, args.cache, args.vector_store)
+
+        from benchmarks.common import git_commit, peak_rss_mb
+
+        bodies = load_requests(args.requests) * args.repeat
+        qdrant_path = os.environ["QDRANT_PATH"]
+        report = {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "config": {
+                "requests": len(bodies),
+                "concurrency": args.concurrency,
+                "mock_tokens": args.tokens,
+                "mock_token_delay": args.token_delay,
+                "mock_prefill_delay": args.prefill_delay,
+                "cache": args.cache,
+                "vector_store": args.vector_store,
+            },
+            "import": benchmark_import(),
+            "ingestion": benchmark_ingestion(qdrant_path, data_directory, args.vector_store == "numpy"),
+        }
+        report.update(asyncio.run(benchmark_api(args, bodies)))
+        report["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,23 @@
 import React, { ChangeEvent, useState } from 'react';
-import { addMessage, updateLatestAssistantMessage } from '../features/chat/chatSlice';
+import { addMessage, failLatestAssistantMessage, updateLatestAssistantMessage } from '../features/chat/chatSlice';
 import { useAppDispatch, useAppSelector } from '../app/hooks';
 import { RootState } from '../app/store';
 import { Send } from 'lucide-react'
 
+// A server-sent event, its data lines joined with newlines
+const parseEvent = (raw: string) => {
+  let type = 'message';
+  const data: string[] = [];
+  for (const line of raw.split('\n')) {
+    if (line.startsWith('event:')) {
+      type = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      data.push(line.startsWith('data: ') ? line.slice(6) : line.slice(5));
+    }
+  }
+  return { type, data: data.join('\n') };
+};
+
 const SendMessageForm = () => {
   const [message, setMessage] = useState('');
   const dispatch = useAppDispatch();
@@ -46,6 +60,8 @@ const SendMessageForm = () => {
     dispatch(addMessage({ content: "", role: 'assistant' }));
 
     const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
 
     let responding = true
 
@@ -57,15 +73,21 @@ const SendMessageForm = () => {
         break;
       }
 
-      const chunk = new TextDecoder().decode(value);
-      const dataPieces = chunk.split('data: ');
-
-      for (const piece of dataPieces) {
-        if (piece !== '') {
-          const formattedPiece = piece.replace(/(\r\n|\n|\r)/gm, "")
-          dispatch(updateLatestAssistantMessage(formattedPiece));
-          scrollToBottom();
+      // Events can be split across reads, only the ones ended by a blank line are complete
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop() ?? '';
+
+      for (const raw of events) {
+        const event = parseEvent(raw);
+        if (event.type === 'error') {
+          // A failed answer ends with an `error` event
+          dispatch(failLatestAssistantMessage(event.data));
+          responding = false
+          break;
         }
+        dispatch(updateLatestAssistantMessage(event.data));
+        scrollToBottom();
       }
     }
 
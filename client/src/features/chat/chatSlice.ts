@@ -30,9 +30,16 @@ export const chatSlice = createSlice({
             if (latestAssistantMessage) {
                 latestAssistantMessage.content += action.payload;
             }
+        },
+        failLatestAssistantMessage: (state, action) => {
+            // An interrupted answer is dropped, so it's never sent back as history
+            if (state.messages[state.messages.length - 1]?.role === 'assistant') {
+                state.messages.pop();
+            }
+            state.error = action.payload;
         }
     },
 })
 
-export const { addMessage, updateLatestAssistantMessage } = chatSlice.actions;
+export const { addMessage, updateLatestAssistantMessage, failLatestAssistantMessage } = chatSlice.actions;
 export default chatSlice.reducer;
\ No newline at end of file
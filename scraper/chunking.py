@@ -0,0 +1,208 @@
+import json
+import logging
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Iterable, Iterator, List, Tuple
+
+from scraper import config
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Sentence ends followed by whitespace, and blank lines between paragraphs
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+# Markdown headings and numbered section titles like "2.1 Requirements"
+HEADING_PATTERN = re.compile(r"^\s*(#{1,6}\s+\S.*|\d+(\.\d+)*\.?\s+[A-ZĄĆĘŁŃÓŚŹŻ]\S*(\s+\S+){0,8}(?<![.!?:;,]))\s*$")
+
+# Without the tokenizer a word costs TOKENS_PER_WORD tokens, longer runs are cut into pieces of about
+# this many characters per token, so text without spaces can't escape the limit
+CHARS_PER_TOKEN = 4
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def get_tokenizer():
+    """
+    Tokenizer of the embedding model, loaded once by the scraper before the parser processes are forked.
+    None for OpenAI models, or when it can't be loaded, token counts are then estimated from the number of words.
+    """
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        if config.EMBEDDING_BACKEND != "openai":
+            try:
+                from huggingface_hub import hf_hub_download
+                from tokenizers import Tokenizer
+
+                _tokenizer = Tokenizer.from_file(
+                    hf_hub_download(
+                        config.EMBEDDING_MODEL,
+                        "tokenizer.json",
+                        cache_dir=config.MODEL_CACHE_DIR,
+                        local_files_only=config.MODEL_OFFLINE,
+                    )
+                )
+            except Exception as e:
+                logger.warning(f"Failed to load the tokenizer of {config.EMBEDDING_MODEL}, estimating tokens: {e}")
+    return _tokenizer
+
+
+def token_spans(text: str) -> List[Tuple[int, int]]:
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return tokenizer.encode(text, add_special_tokens=False).offsets
+
+    piece = max(1, int(CHARS_PER_TOKEN * config.TOKENS_PER_WORD))
+    spans = []
+    for match in TOKEN_PATTERN.finditer(text):
+        start, end = match.span()
+        spans.extend((i, min(i + piece, end)) for i in range(start, end, piece))
+    return spans
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens of the embedding model, or words and punctuation marks times TOKENS_PER_WORD without its tokenizer
+    """
+    if get_tokenizer() is None:
+        return math.ceil(len(token_spans(text)) * config.TOKENS_PER_WORD)
+    return len(token_spans(text))
+
+
+def split_long(text: str, max_tokens: int) -> Iterator[str]:
+    """
+    Cut a unit longer than `max_tokens` at token boundaries, every piece is counted again, since a piece
+    starting mid-word can be tokenized differently
+    """
+    spans = token_spans(text)
+    step = max_tokens if get_tokenizer() else max(1, int(max_tokens / config.TOKENS_PER_WORD))
+    start = 0
+    while start < len(spans):
+        end = min(start + step, len(spans))
+        while end - start > 1 and count_tokens(text[spans[start][0]:spans[end - 1][1]]) > max_tokens:
+            end -= 1
+        yield text[spans[start][0]:spans[end - 1][1]]
+        start = end
+
+
+class BaseChunker(ABC):
+    def __init__(self, chunk_tokens: int, overlap_tokens: int):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+
+    @abstractmethod
+    def chunk(self, text: str) -> List[str]:
+        ...
+
+    def pack(self, units: Iterable[str], separator: str = " ") -> List[str]:
+        """
+        Pack units (sentences, records) into windows of at most `chunk_tokens` tokens, every window starts with
+        the trailing units of the previous one, up to `overlap_tokens`. Every unit is counted once, so it's linear.
+        An empty unit marks a section boundary, windows never span across it.
+        """
+        chunks = []
+        window: deque[Tuple[str, int]] = deque()
+        window_tokens = 0
+        fresh = False  # Whether the window holds units not emitted yet
+
+        def emit():
+            nonlocal window_tokens, fresh
+            if fresh:
+                chunks.append(separator.join(unit for unit, _ in window))
+            fresh = False
+            while window and window_tokens > self.overlap_tokens:
+                window_tokens -= window.popleft()[1]
+
+        for unit in units:
+            if not unit:
+                emit()
+                window.clear()
+                window_tokens = 0
+                continue
+
+            tokens = count_tokens(unit)
+            if tokens > self.chunk_tokens:
+                emit()
+                window.clear()
+                window_tokens = 0
+                chunks.extend(split_long(unit, self.chunk_tokens))
+                continue
+
+            if window_tokens + tokens > self.chunk_tokens:
+                emit()
+                while window and window_tokens + tokens > self.chunk_tokens:
+                    window_tokens -= window.popleft()[1]
+
+            window.append((unit, tokens))
+            window_tokens += tokens
+            fresh = True
+
+        emit()
+        return chunks
+
+
+class TextChunker(BaseChunker):
+    """
+    Token windows over sentences, a heading always starts a new window
+    """
+
+    def sentences(self, text: str) -> Iterator[str]:
+        for line_block in SENTENCE_BOUNDARY.split(text):
+            lines = [line.strip() for line in line_block.splitlines() if line.strip()]
+            buffer = []
+            for line in lines:
+                if HEADING_PATTERN.match(line):
+                    if buffer:
+                        yield " ".join(buffer)
+                        buffer = []
+                    yield ""
+                buffer.append(line)
+            if buffer:
+                yield " ".join(buffer)
+
+    def chunk(self, text):
+        return self.pack(self.sentences(text))
+
+
+class JsonChunker(BaseChunker):
+    """
+    Packs whole JSON records: items of a top level list, or the keys of a top level object.
+    Records are independent, so windows don't overlap. Only a record longer than a chunk is split.
+    Files that aren't valid JSON are chunked as text.
+    """
+
+    def __init__(self, chunk_tokens: int, overlap_tokens: int):
+        super().__init__(chunk_tokens, 0)
+        self.text_overlap_tokens = overlap_tokens
+
+    def chunk(self, text):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return TextChunker(self.chunk_tokens, self.text_overlap_tokens).chunk(text)
+
+        if isinstance(data, list):
+            records = [json.dumps(item, ensure_ascii=False) for item in data]
+        elif isinstance(data, dict):
+            records = [json.dumps({key: value}, ensure_ascii=False) for key, value in data.items()]
+        else:
+            records = [json.dumps(data, ensure_ascii=False)]
+
+        return self.pack(records, separator="\n")
+
+
+CHUNKERS = {
+    "json": JsonChunker,
+}
+
+
+def get_chunker(filepath: str) -> BaseChunker:
+    chunker = CHUNKERS.get(filepath.rsplit(".", 1)[-1].lower(), TextChunker)
+    return chunker(config.CHUNK_TOKENS, config.CHUNK_OVERLAP_TOKENS)
+
+
+def chunk_text(text: str, filepath: str = "") -> List[str]:
+    return get_chunker(filepath).chunk(text)
@@ -5,17 +5,57 @@ from pydantic_settings import BaseSettings
 class ScraperSettings(BaseSettings):
     URL: str = "https://pja.mykhi.org/"  # Default URL to scrape data from
     WORKERS: int = 5  # Number of workers to use for scraping
+    CRAWL_WORKERS: int = 10  # Directory listings fetched concurrently
+    PER_HOST_CONNECTIONS: int = 5  # Concurrent connections to a single host, shared by all workers
+    DOWNLOAD_CHUNK_SIZE: int = 256 * 1024
+    DOWNLOAD_RETRIES: int = 3
+    DOWNLOAD_BACKOFF: float = 1.0  # Seconds before the first retry, doubled on every next one
     HEADLESS: bool = True  # Use headless mode for the browser
 
     QDRANT_HOST: str = "http://qdrant:6333"
     QDRANT_API_KEY: Optional[str] = None
     QDRANT_COLLECTION_NAME: str = "documents"
+    QDRANT_PATH: Optional[str] = None  # Index into a local mode Qdrant in this directory instead of QDRANT_HOST
+    NUMPY_INDEX_DIRECTORY: str = "cache/vector_index"  # Written by --export-numpy, read by the API's numpy store
+    NUMPY_IVF_LISTS: int = 0  # Clusters of the exported IVF index, 0 exports a flat index searched by brute force
 
-    DATA_DIRECTORY: str = "data/"
+    DATA_DIRECTORY: str = "data/"  # Every file in it is indexed, caches and indexes live in cache/
+    URL_HASH_MAPPING_FILE: str = "url_hash_mapping.db"  # SQLite store of url hashes to the original urls
+    CRAWL_STATE_FILE: str = "crawl_state.db"  # ETag, Last-Modified and content hash of downloaded files
+    CHANGES_FILE: str = "changes.json"  # Files added, modified and deleted by the last crawl
+    INDEX_VERSION_FILE: str = "data/.index_version"  # Touched after indexing, API drops its caches on change
 
     OLLAMA_HOST: str = "http://ollama:8000"  # Pydantic is dumb, and raises ValidationError
 
     OPENAI_KEY: Optional[str] = None
 
+    PDF_PARSER: str = "pdfplumber"  # pdfplumber or pymupdf
+    PARSER_WORKERS: int = 4  # Processes parsing files, 0 parses in the main process
+    PARSE_TIMEOUT: int = 300  # Seconds a single file may take to parse before it's skipped
+
+    CHUNK_TOKENS: int = 256  # Maximal chunk size, in tokens of the embedding model, keep it under its 512 limit
+    CHUNK_OVERLAP_TOKENS: int = 32  # Tokens repeated from the end of the previous chunk, at most half a chunk
+    # Tokens per word and punctuation mark assumed when the embedding model's tokenizer can't be loaded,
+    # subword tokenizers of English models split Polish words into several tokens
+    TOKENS_PER_WORD: float = 2.0
+    EMBEDDING_BACKEND: str = "fastembed"  # fastembed, sentence_transformers or openai
+    EMBEDDING_MODEL: str = "BAAI/bge-small-en"  # Must match the model used by the API
+    EMBEDDING_BATCH_SIZE: int = 64
+    MODEL_CACHE_DIR: str = "cache/models"  # fastembed models, shared with the API, kept out of DATA_DIRECTORY
+    MODEL_OFFLINE: bool = False  # Only load cached models and tokenizers, never reach Hugging Face
+    HYBRID_INDEX: bool = True  # Also store BM25 sparse vectors, used by the API's hybrid retrieval mode
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    BM25_AVG_LENGTH: float = 40  # Expected average number of tokens in a chunk
+    SPARSE_STATS_FILE: str = "data/.sparse_stats.json"  # Document frequencies read by the API for IDF
+    QUANTIZATION: str = "scalar"  # scalar (int8), binary or none, the originals are kept for rescoring
+    QUANTILE: float = 0.99  # Share of the values used to find the int8 range, drops outliers
+    VECTORS_ON_DISK: bool = True  # Keep the original vectors on disk, only the quantized ones in RAM
+    PAYLOAD_ON_DISK: bool = True
+    HNSW_M: int = 16  # Edges per node in the HNSW graph, more is better recall and more memory
+    HNSW_EF_CONSTRUCT: int = 100
+    UPSERT_BATCH_SIZE: int = 256  # Points kept in memory and sent to qdrant per request
+    MANIFEST_FILE: str = "index_manifest.jsonl"  # Indexed files with their content hash and point ids
+
     class Config:
         env_file = ".env"
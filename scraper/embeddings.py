@@ -0,0 +1,91 @@
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+from scraper import config
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class BaseEmbedder(ABC):
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts, vectors are returned in the same order as the texts
+        """
+
+    @property
+    def vector_name(self) -> str:
+        # Same naming as qdrant_client uses for fastembed models, so collections built with `add` stay compatible
+        return f"fast-{self.model_name.split('/')[-1].lower()}"
+
+    def embed_batches(self, texts: Iterable[str], batch_size: int) -> Iterator[List[float]]:
+        for batch in batched(texts, batch_size):
+            yield from self.embed(batch)
+
+
+class FastEmbedEmbedder(BaseEmbedder):
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        from fastembed import TextEmbedding
+
+        self.model = TextEmbedding(model_name=model_name, cache_dir=config.MODEL_CACHE_DIR)
+
+    def embed(self, texts):
+        return [vector.tolist() for vector in self.model.embed(texts, batch_size=len(texts))]
+
+
+class SentenceTransformerEmbedder(BaseEmbedder):
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(
+            model_name,
+            device="cuda" if torch.cuda.is_available() else "cpu",
+        )
+
+    def embed(self, texts):
+        return self.model.encode(
+            texts, batch_size=len(texts), normalize_embeddings=True
+        ).tolist()
+
+
+class OpenAIEmbedder(BaseEmbedder):
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        from openai import OpenAI
+
+        self.client = OpenAI(api_key=config.OPENAI_KEY)
+
+    @property
+    def vector_name(self) -> str:
+        return self.model_name
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(
+            input=[text.replace("\n", " ") for text in texts], model=self.model_name
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+EMBEDDERS = {
+    "fastembed": FastEmbedEmbedder,
+    "sentence_transformers": SentenceTransformerEmbedder,
+    "openai": OpenAIEmbedder,
+}
+
+
+def get_embedder() -> BaseEmbedder:
+    embedder = EMBEDDERS.get(config.EMBEDDING_BACKEND)
+    if not embedder:
+        raise ValueError(f"No embedder found for backend: {config.EMBEDDING_BACKEND}")
+    return embedder(config.EMBEDDING_MODEL)
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import shutil
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from scraper.sparse import SPARSE_VECTOR_NAME
+
+logger = logging.getLogger(__name__)
+
+# Name of the file pointing at the active index inside the export directory, read by app/chat/vector_store.py
+CURRENT_FILE = "CURRENT"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(
+    vectors: np.ndarray, lists: int, iterations: int = 10, batch_size: int = 65536
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means over normalized vectors, returns the cluster of every vector and the centroids.
+    Assignments are computed in batches, so the distance matrix never holds more than `batch_size` rows.
+    """
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    assignment = np.zeros(len(vectors), dtype=np.int64)
+
+    for _ in range(iterations):
+        for start in range(0, len(vectors), batch_size):
+            assignment[start:start + batch_size] = np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        # Empty clusters keep their previous centroid
+        filled = np.bincount(assignment, minlength=lists) > 0
+        centroids[filled] = normalize(sums[filled])
+
+    return assignment, centroids
+
+
+def dense_vector(qdrant_client: QdrantClient, collection_name: str) -> Tuple[str, int]:
+    """
+    Name and size of the dense vector of the collection
+    """
+    vectors = qdrant_client.get_collection(collection_name).config.params.vectors
+    if not isinstance(vectors, dict) or len(vectors) != 1:
+        raise ValueError(f"Expected a single named dense vector in {collection_name}, got {vectors}")
+    name, params = next(iter(vectors.items()))
+    return name, params.size
+
+
+def export_numpy(
+    qdrant_client: QdrantClient, collection_name: str, directory: str, lists: int = 0, page_size: int = 256
+):
+    """
+    Export the collection to a NumPy index for the API's VECTOR_STORE=numpy, files are memory-mapped by the API,
+    so every uvicorn worker shares one copy in the page cache.
+
+    The index is written into a new subdirectory of `directory` and swapped in by replacing the CURRENT file,
+    API workers pick it up once the index version is bumped. With `lists` the vectors are clustered into an IVF
+    index and stored grouped by cluster, otherwise they are searched by brute force.
+    """
+    vector_name, dimension = dense_vector(qdrant_client, collection_name)
+
+    ids: List[str] = []
+    payloads: List[dict] = []
+    vectors: List[List[float]] = []
+    sparse_vectors: List[Optional[models.SparseVector]] = []
+
+    offset = None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name, limit=page_size, offset=offset, with_payload=True, with_vectors=True
+        )
+        for point in points:
+            ids.append(str(point.id))
+            payloads.append(point.payload)
+            vectors.append(point.vector[vector_name])
+            sparse_vectors.append(point.vector.get(SPARSE_VECTOR_NAME))
+        if offset is None:
+            break
+
+    dense = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dimension))
+    lists = min(lists, len(dense))
+    meta = {"vector_name": vector_name, "count": len(dense), "dimension": dimension, "lists": lists}
+
+    target = os.path.join(directory, str(time.time_ns()))
+    os.makedirs(target)
+
+    if lists:
+        assignment, centroids = kmeans(dense, lists)
+        order = np.argsort(assignment, kind="stable")
+        np.save(os.path.join(target, "centroids.npy"), centroids.astype(np.float32))
+        list_sizes = np.bincount(assignment, minlength=lists)
+        np.save(os.path.join(target, "list_offsets.npy"), np.concatenate([[0], np.cumsum(list_sizes)]))
+    else:
+        order = np.arange(len(dense))
+    np.save(os.path.join(target, "vectors.npy"), dense[order])
+
+    # Payloads stay on disk as JSON lines, only the hits are read
+    payload_offsets = [0]
+    with open(os.path.join(target, "payloads.jsonl"), "wb") as f:
+        for row in order:
+            line = json.dumps([ids[row], payloads[row]], ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            payload_offsets.append(payload_offsets[-1] + len(line))
+    np.save(os.path.join(target, "payload_offsets.npy"), np.asarray(payload_offsets, dtype=np.int64))
+
+    # BM25 vectors as an inverted index: the postings of every term are stored next to each other
+    terms, rows, values = [], [], []
+    for row, original in enumerate(order):
+        if sparse_vectors[original] is not None:
+            terms.extend(sparse_vectors[original].indices)
+            rows.extend([row] * len(sparse_vectors[original].indices))
+            values.extend(sparse_vectors[original].values)
+    if terms:
+        terms = np.asarray(terms, dtype=np.int64)
+        by_term = np.argsort(terms, kind="stable")
+        unique_terms, counts = np.unique(terms[by_term], return_counts=True)
+        np.save(os.path.join(target, "sparse_terms.npy"), unique_terms)
+        np.save(os.path.join(target, "sparse_offsets.npy"), np.concatenate([[0], np.cumsum(counts)]))
+        np.save(os.path.join(target, "sparse_rows.npy"), np.asarray(rows, dtype=np.int32)[by_term])
+        np.save(os.path.join(target, "sparse_values.npy"), np.asarray(values, dtype=np.float32)[by_term])
+        meta["sparse"] = True
+
+    with open(os.path.join(target, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    current = os.path.join(directory, CURRENT_FILE)
+    with open(f"{current}.tmp", "w") as f:
+        f.write(os.path.basename(target))
+    os.replace(f"{current}.tmp", current)
+
+    # Workers still searching a previous index keep their memory maps, the files go away when they reload
+    for name in os.listdir(directory):
+        if name not in (CURRENT_FILE, os.path.basename(target)) and os.path.isdir(os.path.join(directory, name)):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    logger.info(f"Exported {len(dense)} points of {collection_name} to {target}, {lists or 'no'} IVF lists")
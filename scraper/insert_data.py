@@ -1,111 +1,326 @@
+import argparse
+import hashlib
 import os
 import logging
-from typing import List
-import uuid
-from openai import OpenAI
-from qdrant_client import QdrantClient
+import time
+from typing import Iterator, List, Optional
+from qdrant_client import QdrantClient, models
 
-from scraper.parsers import FileParser
+from scraper.embeddings import BaseEmbedder, get_embedder
+from scraper.export import export_numpy
+from scraper.manifest import Manifest
+from scraper.sparse import SPARSE_VECTOR_NAME, SparseStats, encode_document
+from scraper.state import ChangeSet
+from scraper.workers import ParserPool
 
 from scraper import config
 
-from sentence_transformers import SentenceTransformer
-import torch
-import nltk
-nltk.download('punkt')
-
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-model = SentenceTransformer(
-    "all-MiniLM-L6-v2",
-    device="cuda" if torch.cuda.is_available() else "cpu",
-)
+def walk_files(directory: str) -> Iterator[str]:
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            if not file.startswith("."):
+                yield os.path.join(root, file)
 
 
-def get_embedding(text: str, model: str = "text-embedding-3-small"):
-    text = text.replace("\n", " ")
-    openai_client = OpenAI(
-        config.OPENAI_KEY
-    )  # todo, obj should not be created every time
-    return openai_client.embeddings.create(input=[text], model=model).data[0].embedding
+def file_hash(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
 
 
-def convert_to_vector(text: str) -> List[float]:
-    if config.OPENAI_KEY:
-        vectors = get_embedding(text)
-    else:
-        vectors = model.encode([text])[0].tolist()
-    return vectors
-
-
-def chunk_text(text: str, max_sentences: int = 2) -> List[str]:
-    sentences = nltk.sent_tokenize(text)
-    chunks = []
-    current_chunk = ''
-    for sentence in sentences:
-        if len(current_chunk.split('\n')) >= max_sentences:
-            chunks.append(current_chunk.strip())
-            current_chunk = ''
-        current_chunk += sentence + '\n'
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
-    return chunks
-
-
-def process_file(root, file):
-    filepath = os.path.join(root, file)
-    try:
-        parser = FileParser(filepath)
-        data = parser.parse()
-    except Exception as e:
-        print(f"Failed to parse file: {file}, error: {e}")
+def collection_names(qdrant_client: QdrantClient) -> set:
+    return {collection.name for collection in qdrant_client.get_collections().collections}
+
+
+def alias_targets(qdrant_client: QdrantClient, alias: str) -> List[str]:
+    return [
+        alias_description.collection_name
+        for alias_description in qdrant_client.get_aliases().aliases
+        if alias_description.alias_name == alias
+    ]
+
+
+INDEXED_PAYLOAD_FIELDS = ["path", "filename"]
+
+
+def quantization_config() -> Optional[models.QuantizationConfig]:
+    """
+    Quantized copies of the vectors kept in RAM, searched first and rescored with the originals
+    """
+    if config.QUANTIZATION == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=config.QUANTILE, always_ram=True
+            )
+        )
+    if config.QUANTIZATION == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if config.QUANTIZATION == "none":
+        return None
+    raise ValueError(f"Unknown QUANTIZATION: {config.QUANTIZATION}, expected scalar, binary or none")
+
+
+def ensure_collection(qdrant_client: QdrantClient, embedder: BaseEmbedder, collection_name: str):
+    if collection_name in collection_names(qdrant_client) or alias_targets(qdrant_client, collection_name):
         return
 
-    chunks = chunk_text(data.content)
-    for chunk in chunks:
-        id_ = uuid.uuid4().hex
-
-        yield {
-            "id": id_,
-            "content": chunk,
-            "metadata": {
-                "filename": data.filename,
-                "path": data.path,
-                "metadata": data.metadata,
-            },
-        }
-
-
-def process_files(qdrant_client: QdrantClient):
-    directory = os.walk(config.DATA_DIRECTORY)
-    points = []
-
-    for root, _, files in directory:
-        for file in files:
-            logger.info(f"Processing file: {file}")
-            payloads = process_file(root, file)
-            for i, payload in enumerate(payloads):
-                logger.info(f"| Processing payload: {i} for file: {file}")
-                points.append(payload)
-
-    qdrant_client.add(
-        collection_name=config.QDRANT_COLLECTION_NAME,
-        ids=[point["id"] for point in points],
-        documents=[point["content"] for point in points],
-        metadata=[point["metadata"] for point in points],
+    vector_size = len(embedder.embed(["vector size probe"])[0])
+    qdrant_client.create_collection(
+        collection_name=collection_name,
+        vectors_config={
+            embedder.vector_name: models.VectorParams(
+                size=vector_size,
+                distance=models.Distance.COSINE,
+                on_disk=config.VECTORS_ON_DISK,
+            )
+        },
+        sparse_vectors_config={SPARSE_VECTOR_NAME: models.SparseVectorParams()} if config.HYBRID_INDEX else None,
+        hnsw_config=models.HnswConfigDiff(m=config.HNSW_M, ef_construct=config.HNSW_EF_CONSTRUCT),
+        quantization_config=quantization_config(),
+        on_disk_payload=config.PAYLOAD_ON_DISK,
     )
+    for field_name in INDEXED_PAYLOAD_FIELDS:
+        qdrant_client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+
+
+def has_sparse_vectors(qdrant_client: QdrantClient, collection_name: str) -> bool:
+    sparse_vectors = qdrant_client.get_collection(collection_name).config.params.sparse_vectors
+    return SPARSE_VECTOR_NAME in (sparse_vectors or {})
+
+
+def swap_alias(qdrant_client: QdrantClient, collection_name: str):
+    """
+    Atomically point the QDRANT_COLLECTION_NAME alias at the freshly built collection and drop the previous one
+    """
+    alias = config.QDRANT_COLLECTION_NAME
+    previous = alias_targets(qdrant_client, alias)
+
+    if alias in collection_names(qdrant_client):
+        logger.warning(f"Replacing collection {alias} with an alias, it is offline until the alias is created")
+        qdrant_client.delete_collection(collection_name=alias)
+
+    operations = []
+    if previous:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(
+        models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)
+        )
+    )
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+
+    for previous_collection in previous:
+        if previous_collection != collection_name:
+            qdrant_client.delete_collection(collection_name=previous_collection)
+
+
+def delete_points(qdrant_client: QdrantClient, collection_name: str, ids: List[str]):
+    if ids:
+        qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=ids),
+        )
+
+
+def upsert_points(
+    qdrant_client: QdrantClient,
+    embedder: BaseEmbedder,
+    collection_name: str,
+    points: List[dict],
+    sparse_stats: Optional[SparseStats] = None,
+):
+    """
+    Embed the points in batches of EMBEDDING_BATCH_SIZE and upsert them into the collection in one request.
+    With `sparse_stats` the points also get a BM25 sparse vector.
+    """
+    vectors = embedder.embed_batches(
+        (point["content"] for point in points), config.EMBEDDING_BATCH_SIZE
+    )
+
+    structs = []
+    for point, vector in zip(points, vectors):
+        point_vectors = {embedder.vector_name: vector}
+        if sparse_stats is not None:
+            point_vectors[SPARSE_VECTOR_NAME] = encode_document(point["content"])
+            sparse_stats.add(point_vectors[SPARSE_VECTOR_NAME])
+
+        structs.append(
+            models.PointStruct(
+                id=point["id"],
+                vector=point_vectors,
+                payload={"document": point["content"], **point["metadata"]},
+            )
+        )
+
+    qdrant_client.upsert(collection_name=collection_name, points=structs)
+
+
+def process_files(
+    qdrant_client: QdrantClient,
+    collection_name: str,
+    manifest: Manifest,
+    changes: Optional[ChangeSet] = None,
+    sparse_stats: Optional[SparseStats] = None,
+):
+    """
+    Stream new and changed files through parse -> chunk -> embed -> upsert, keeping at most UPSERT_BATCH_SIZE
+    points in memory. Parsing and chunking run in a pool of PARSER_WORKERS processes.
+    A file is recorded in the manifest once all of its points are upserted, then its stale points are deleted.
+    Points of files removed from the data directory are deleted at the end.
+    With a change set from the scraper only the files it lists are looked at, instead of walking the data directory.
+    """
+    embedder = get_embedder()
+    ensure_collection(qdrant_client, embedder, collection_name)
+    if not has_sparse_vectors(qdrant_client, collection_name):
+        sparse_stats = None
+
+    batch: List[dict] = []
+    batch_files: List[dict] = []
+    seen = set()
+    batches = total_points = 0
+
+    def flush():
+        nonlocal batch, batch_files, batches, total_points
+        if batch:
+            upsert_points(qdrant_client, embedder, collection_name, batch, sparse_stats)
+            batches += 1
+            total_points += len(batch)
+
+        for entry in batch_files:
+            previous = manifest.files.get(entry["path"], {})
+            delete_points(qdrant_client, collection_name, list(set(previous.get("ids", [])) - set(entry["ids"])))
+        manifest.record(batch_files)
+        # Next to the manifest, so a crash doesn't lose the document frequencies of the files recorded so far
+        if sparse_stats is not None:
+            sparse_stats.save()
+
+        if batch:
+            logger.info(
+                f"Upserted batch {batches}: {len(batch)} points, "
+                f"{total_points} points and {len(manifest.files)} files indexed in total"
+            )
+        batch, batch_files = [], []
+
+    hashes = {}
+
+    if changes is None:
+        candidates = walk_files(config.DATA_DIRECTORY)
+    else:
+        candidates = (path for path in changes.added + changes.modified if os.path.exists(path))
+
+    def changed_files() -> Iterator[str]:
+        for filepath in candidates:
+            seen.add(filepath)
+            hashes[filepath] = file_hash(filepath)
+            if manifest.files.get(filepath, {}).get("hash") != hashes[filepath]:
+                yield filepath
+
+    parser_pool = ParserPool(workers=config.PARSER_WORKERS, timeout=config.PARSE_TIMEOUT)
+    for filepath, points in parser_pool.imap(changed_files()):
+        if points is None:
+            # Not recorded, so its previous points stay and the next run retries it
+            hashes.pop(filepath)
+            logger.warning(f"Keeping the previous points of {filepath}, it will be retried on the next run")
+            continue
+
+        logger.info(f"Processing file: {filepath}")
+        ids = []
+        for point in points:
+            ids.append(point["id"])
+            batch.append(point)
+            if len(batch) >= config.UPSERT_BATCH_SIZE:
+                flush()
+        batch_files.append({"path": filepath, "hash": hashes.pop(filepath), "ids": ids})
+
+    flush()
+
+    if changes is None:
+        deleted = [path for path in manifest.files if path not in seen]
+    else:
+        deleted = [path for path in changes.deleted if path in manifest.files]
+    for path in deleted:
+        logger.info(f"Removing deleted file: {path}")
+        delete_points(qdrant_client, collection_name, manifest.files[path]["ids"])
+    manifest.remove(deleted)
+
+
+def update(qdrant_client: QdrantClient, changes: Optional[ChangeSet] = None):
+    """
+    Index only new and changed files into the live collection, it stays queryable the whole time
+    """
+    manifest = Manifest(config.MANIFEST_FILE)
+    sparse_stats = SparseStats(config.SPARSE_STATS_FILE)
+    process_files(qdrant_client, config.QDRANT_COLLECTION_NAME, manifest, changes, sparse_stats)
+    manifest.compact()
+
+
+def rebuild(qdrant_client: QdrantClient):
+    """
+    Index everything into a shadow collection and swap the alias once it's complete.
+    An interrupted rebuild is resumed on the next run.
+    """
+    manifest = Manifest(f"{config.MANIFEST_FILE}.rebuild")
+    if manifest.collection is None:
+        manifest.set_collection(f"{config.QDRANT_COLLECTION_NAME}_{int(time.time())}")
+    logger.info(f"Building shadow collection: {manifest.collection}")
+
+    sparse_stats = SparseStats(f"{config.SPARSE_STATS_FILE}.rebuild")
+    process_files(qdrant_client, manifest.collection, manifest, sparse_stats=sparse_stats)
+    swap_alias(qdrant_client, manifest.collection)
+
+    manifest.compact()
+    os.replace(manifest.path, config.MANIFEST_FILE)
+    if os.path.exists(sparse_stats.path):
+        os.replace(sparse_stats.path, config.SPARSE_STATS_FILE)
+
+
+def bump_index_version():
+    """
+    Touch the index version file, so the API invalidates results cached for the previous collection
+    """
+    os.makedirs(os.path.dirname(config.INDEX_VERSION_FILE) or ".", exist_ok=True)
+    with open(config.INDEX_VERSION_FILE, "w") as f:
+        f.write(str(time.time()))
 
 
 if __name__ == "__main__":
-    client = QdrantClient(
-        url=config.QDRANT_HOST, api_key=config.QDRANT_API_KEY, timeout=300
+    arg_parser = argparse.ArgumentParser(description="Insert scraped data into qdrant")
+    arg_parser.add_argument(
+        "--rebuild", action="store_true", help="Re-index every file into a new collection and swap it in"
+    )
+    arg_parser.add_argument(
+        "--changes", help="Change set written by the scraper, only the files it lists are (re)indexed or removed"
     )
+    arg_parser.add_argument(
+        "--export-numpy", action="store_true", help="Export the collection for the API's VECTOR_STORE=numpy"
+    )
+    args = arg_parser.parse_args()
 
-    client.delete_collection(collection_name=config.QDRANT_COLLECTION_NAME)
+    if config.QDRANT_PATH:
+        client = QdrantClient(path=config.QDRANT_PATH)
+    else:
+        client = QdrantClient(
+            url=config.QDRANT_HOST, api_key=config.QDRANT_API_KEY, timeout=300
+        )
 
     logger.info("Processing files")
-    process_files(client)
+    if args.rebuild or not alias_targets(client, config.QDRANT_COLLECTION_NAME):
+        rebuild(client)
+    else:
+        update(client, ChangeSet.load(args.changes) if args.changes else None)
+    if args.export_numpy:
+        export_numpy(client, config.QDRANT_COLLECTION_NAME, config.NUMPY_INDEX_DIRECTORY, config.NUMPY_IVF_LISTS)
+    bump_index_version()
     logger.info("Data inserted successfully!")
@@ -0,0 +1,64 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+
+class Manifest:
+    """
+    Append-only JSON lines log of the indexed files and the point ids stored for each of them.
+    The last record of a path wins, so a crashed run keeps everything recorded before the crash.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.collection: Optional[str] = None
+        self.files: Dict[str, dict] = {}
+
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        self._apply(json.loads(line))
+        except FileNotFoundError:
+            pass
+
+    def _apply(self, record: dict):
+        if "collection" in record:
+            self.collection = record["collection"]
+        elif record.get("deleted"):
+            self.files.pop(record["path"], None)
+        else:
+            self.files[record["path"]] = record
+
+    def _append(self, records: List[dict]):
+        if not records:
+            return
+
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        for record in records:
+            self._apply(record)
+
+    def set_collection(self, collection: str):
+        self._append([{"collection": collection}])
+
+    def record(self, entries: List[dict]):
+        """
+        Record files as indexed, every entry is `{"path": ..., "hash": ..., "ids": [...]}`
+        """
+        self._append(entries)
+
+    def remove(self, paths: List[str]):
+        self._append([{"path": path, "deleted": True} for path in paths])
+
+    def compact(self):
+        """
+        Rewrite the log with only the current record of every file
+        """
+        records = [{"collection": self.collection}] if self.collection else []
+        records.extend(self.files.values())
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        os.replace(tmp_path, self.path)
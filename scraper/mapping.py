@@ -0,0 +1,74 @@
+import json
+import os
+import sqlite3
+from typing import Dict, Optional
+
+LEGACY_MAPPING_FILE = "url_hash_mapping.json"
+
+
+class UrlHashMapping:
+    """
+    Mapping of url hashes to the original urls. Lookups are served from memory,
+    new entries are written to SQLite in batches of `flush_size`.
+    """
+
+    def __init__(self, path: str, flush_size: int = 100):
+        self.path = path
+        self.flush_size = flush_size
+        self._connection: Optional[sqlite3.Connection] = None
+        self._mapping: Optional[Dict[str, str]] = None
+        self._pending: Dict[str, str] = {}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS url_hash_mapping (url_hash TEXT PRIMARY KEY, url TEXT NOT NULL)"
+            )
+        return self._connection
+
+    @property
+    def mapping(self) -> Dict[str, str]:
+        if self._mapping is None:
+            self._mapping = dict(self.connection.execute("SELECT url_hash, url FROM url_hash_mapping"))
+            if not self._mapping:
+                self._migrate_legacy_mapping()
+        return self._mapping
+
+    def get(self, url_hash: str) -> Optional[str]:
+        return self.mapping.get(url_hash)
+
+    def add(self, url_hash: str, url: str):
+        self.mapping[url_hash] = url
+        self._pending[url_hash] = url
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO url_hash_mapping (url_hash, url) VALUES (?, ?)",
+                self._pending.items(),
+            )
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _migrate_legacy_mapping(self):
+        if not os.path.exists(LEGACY_MAPPING_FILE):
+            return
+
+        with open(LEGACY_MAPPING_FILE, "r") as f:
+            legacy_mapping = json.load(f)
+
+        self._mapping.update(legacy_mapping)
+        self._pending.update(legacy_mapping)
+        self.flush()
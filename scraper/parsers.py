@@ -1,31 +1,46 @@
 from abc import ABC, abstractmethod
-import json
 from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
 
 import pdfplumber
 
+from scraper import config
+from scraper.mapping import UrlHashMapping
+
+url_hash_mapping = UrlHashMapping(config.URL_HASH_MAPPING_FILE)
+
 
 def find_url_hash_mapping(url_hash: str) -> str:
     """
-    Find original url from url_hash
+    Find original url from url_hash, the mapping is loaded once per process
     """
-    mapping_file = "url_hash_mapping.json"
-    try:
-        with open(mapping_file, "r") as f:
-            mapping = json.load(f)
-    except FileNotFoundError:
-        return None
+    return url_hash_mapping.get(url_hash)
+
 
-    return mapping.get(url_hash)
+def get_url_hash(filepath: str) -> str:
+    """
+    Hash of the original url, stored by the scraper in the file name: `{name}_{url_hash}.{ext}`
+    """
+    return filepath.split("/")[-1].rsplit("_", 1)[-1].split(".")[0]
 
 
 @dataclass
 class ParsedData:
-    content: str
+    pages: Iterable[str]  # Lazily extracted, so huge documents are never materialised as a single string
     filename: str
     path: str
     metadata: dict
 
+    @property
+    def content(self) -> str:
+        return "".join(self.pages)
+
+    @property
+    def title(self) -> Optional[str]:
+        # pdfplumber keeps the PDF's own keys ("Title"), PyMuPDF lowercases them
+        metadata = self.metadata or {}
+        return metadata.get("Title") or metadata.get("title") or None
+
 
 class BaseParser(ABC):
     @abstractmethod
@@ -46,21 +61,47 @@ class BaseParser(ABC):
 
 class PdfParser(BaseParser):
     def parse(self, filepath):
-        with pdfplumber.open(filepath) as pdf:
-            content = ''.join([page.extract_text() for page in pdf.pages])
-            metadata = pdf.metadata
+        file_url, file_name = self.get_file_properties(filepath)
+
+        # Opened once, the pages generator closes it after the last page
+        pdf = pdfplumber.open(filepath)
+        return ParsedData(self.iter_pages(pdf), file_name, file_url, pdf.metadata)
+
+    def iter_pages(self, pdf) -> Iterator[str]:
+        with pdf:
+            for page in pdf.pages:
+                yield page.extract_text()
+                page.flush_cache()
+
+
+class PyMuPdfParser(BaseParser):
+    """
+    Faster PDF backend built on PyMuPDF, selected with `PDF_PARSER=pymupdf`
+    """
+
+    def parse(self, filepath):
+        import fitz
 
         file_url, file_name = self.get_file_properties(filepath)
 
-        return ParsedData(content, file_name, file_url, metadata)
+        pdf = fitz.open(filepath)
+        return ParsedData(self.iter_pages(pdf), file_name, file_url, pdf.metadata)
+
+    def iter_pages(self, pdf) -> Iterator[str]:
+        with pdf:
+            for page in pdf:
+                yield page.get_text()
 
 
 class TxtParser(BaseParser):
     def parse(self, filepath):
-        with open(filepath, "r") as file:
-            file_url, file_name = self.get_file_properties(filepath)
+        file_url, file_name = self.get_file_properties(filepath)
 
-            return ParsedData(file.read(), file_name, file_url, {})
+        return ParsedData(self.iter_pages(filepath), file_name, file_url, {})
+
+    def iter_pages(self, filepath) -> Iterator[str]:
+        with open(filepath, "r") as file:
+            yield file.read()
 
 
 class ParserFactory:
@@ -80,7 +121,12 @@ class ParserFactory:
         return parser()
 
 
-ParserFactory.register_parser("pdf", PdfParser)
+PDF_PARSERS = {
+    "pdfplumber": PdfParser,
+    "pymupdf": PyMuPdfParser,
+}
+
+ParserFactory.register_parser("pdf", PDF_PARSERS[config.PDF_PARSER])
 ParserFactory.register_parser("txt", TxtParser)
 ParserFactory.register_parser("json", TxtParser)
 
@@ -1,14 +1,16 @@
 import asyncio
 from dataclasses import dataclass, field
 import hashlib
-import json
 import logging
 import os
 from typing import List, Optional
 
+import aiofiles
 import aiohttp
+import lxml.html
 from scraper.config import ScraperSettings as Config
-from selenium_driverless.types.by import By
+from scraper.mapping import UrlHashMapping
+from scraper.state import ChangeSet, CrawlState, FileState
 from selenium_driverless import webdriver
 
 from scraper import config as settings
@@ -49,19 +51,21 @@ class Scraper:
         self.total_downloaded_size = 0
         self.storage_limit = 50 * 1024 * 1024 * 1024
         self.download_queue = asyncio.Queue()
+        self.crawl_queue = asyncio.Queue()
+        self.visited = set()
+        self.session: Optional[aiohttp.ClientSession] = None
+        # The browser is only started for pages that can't be crawled over plain http
+        self.driver: Optional[webdriver.Chrome] = None
+        self.browser_lock = asyncio.Lock()
+        self.url_hash_mapping = UrlHashMapping(config.URL_HASH_MAPPING_FILE)
 
-    def update_url_hash_mapping(self, url_hash: str, original_url: str):
-        mapping_file = "url_hash_mapping.json"
-        try:
-            with open(mapping_file, "r") as f:
-                mapping = json.load(f)
-        except FileNotFoundError:
-            mapping = {}
-
-        mapping[url_hash] = original_url
+        self.crawl_state = CrawlState(config.CRAWL_STATE_FILE)
+        self.crawled_urls = set()
+        self.crawl_errors = 0
+        self.changes = ChangeSet.empty()
 
-        with open(mapping_file, "w") as f:
-            json.dump(mapping, f, indent=4)
+    def update_url_hash_mapping(self, url_hash: str, original_url: str):
+        self.url_hash_mapping.add(url_hash, original_url)
 
     async def download_file(self, file: File, directory_path: str):
         if self.total_downloaded_size > self.storage_limit:
@@ -73,42 +77,123 @@ class Scraper:
         logging.info(f"Downloading {file.url} to {directory_path}")
 
         url_hash = hashlib.md5(file.url.encode("utf-8")).hexdigest()[:10]
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file.url) as response:
-                if response.status == 200:
-                    os.makedirs(directory_path, exist_ok=True)
-
-                    file_splitted = file.name.split(".")
-                    file_ext = file_splitted[-1]
-                    file_name = file_splitted[0]
-
-                    file_name_with_hash = f"{file_name}_{url_hash}.{file_ext}"
-                    file_path = os.path.join(directory_path, file_name_with_hash)
-                    with open(file_path, "wb") as f:
-                        while True:
-                            chunk = await response.content.read(1024)
-                            if not chunk:
-                                break
-                            f.write(chunk)
-                            self.total_downloaded_size += len(chunk)
-
-                            if self.total_downloaded_size > self.storage_limit:
-                                logging.info(
-                                    f"Storage limit reached: {self.total_downloaded_size} > {self.storage_limit}"
-                                )
-                                return
+        file_splitted = file.name.split(".")
+        file_ext = file_splitted[-1]
+        file_name = file_splitted[0]
+
+        file_name_with_hash = f"{file_name}_{url_hash}.{file_ext}"
+        file_path = os.path.join(directory_path, file_name_with_hash)
+
+        for attempt in range(1, self.config.DOWNLOAD_RETRIES + 1):
+            try:
+                change = await self._download(file, file_path)
+                if change:
                     self.update_url_hash_mapping(url_hash, file.url)
-                    logging.info(f"Downloaded {file.url} to {file_path}")
-                else:
-                    logging.error(
-                        f"Failed to download {file.url}: Status {response.status}"
-                    )
+                    self.record_change(change, file_path)
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.config.DOWNLOAD_RETRIES:
+                    logging.error(f"Failed to download {file.url} after {attempt} attempts: {e}")
+                    return
+
+                delay = self.config.DOWNLOAD_BACKOFF * 2 ** (attempt - 1)
+                logging.warning(f"Failed to download {file.url}: {e}, retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    async def _download(self, file: File, file_path: str) -> Optional[str]:
+        """
+        Stream the file to a temporary path and move it in place once it's complete.
+        Files downloaded before are requested conditionally and only replaced when their content changed.
+        Returns "added", "modified" or "unchanged", raises for errors worth retrying and returns None
+        for the ones that are not.
+        """
+        previous = self.crawl_state.get(file.url)
+        headers = {}
+        if previous and os.path.exists(file_path):
+            if previous.etag:
+                headers["If-None-Match"] = previous.etag
+            if previous.last_modified:
+                headers["If-Modified-Since"] = previous.last_modified
+
+        async with self.session.get(file.url, headers=headers) as response:
+            if response.status == 304:
+                return "unchanged"
+            if response.status == 429 or response.status >= 500:
+                response.raise_for_status()
+            if response.status != 200:
+                logging.error(
+                    f"Failed to download {file.url}: Status {response.status}"
+                )
+                return None
+
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = f"{file_path}.part"
+            content_hash = hashlib.sha256()
+            size = 0
+            try:
+                async with aiofiles.open(tmp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(self.config.DOWNLOAD_CHUNK_SIZE):
+                        await f.write(chunk)
+                        content_hash.update(chunk)
+                        size += len(chunk)
+                        self.total_downloaded_size += len(chunk)
+
+                        if self.total_downloaded_size > self.storage_limit:
+                            logging.info(
+                                f"Storage limit reached: {self.total_downloaded_size} > {self.storage_limit}"
+                            )
+                            return None
+
+                state = FileState(
+                    url=file.url,
+                    path=file_path,
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified"),
+                    size=size,
+                    content_hash=content_hash.hexdigest(),
+                )
+                self.crawl_state.update(state)
+
+                if previous and previous.content_hash == state.content_hash and os.path.exists(file_path):
+                    return "unchanged"
+                os.replace(tmp_path, file_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return "modified" if previous else "added"
+
+    def record_change(self, change: str, file_path: str):
+        if change == "unchanged":
+            self.changes.unchanged += 1
+            return
+
+        logging.info(f"{change.capitalize()} {file_path}")
+        getattr(self.changes, change).append(file_path)
+
+    def detect_deleted_files(self):
+        """
+        Files downloaded by the previous crawls that are no longer listed are removed from the data directory
+        """
+        if self.crawl_errors:
+            logging.warning(f"{self.crawl_errors} directories failed to crawl, skipping deleted files detection")
+            return
+
+        for url, state in list(self.crawl_state.states.items()):
+            if url in self.crawled_urls:
+                continue
 
-    async def _get_all_links(self, driver, url: str):
-        await driver.get(url)
+            logging.info(f"Deleted {state.path}")
+            if os.path.exists(state.path):
+                os.remove(state.path)
+            self.changes.deleted.append(state.path)
+            self.crawl_state.remove(url)
+
+    async def _get_all_links(self, url: str):
+        hrefs = await self._fetch_links(url)
+        if hrefs is None:
+            logging.info(f"Falling back to the browser for {url}")
+            hrefs = await self._fetch_links_with_browser(url)
 
-        elements = await driver.find_elements(By.XPATH, "//a[@href]")
-        hrefs = [await element.get_attribute("href") for element in elements]
         hrefs = filter(
             lambda href: href.startswith(url)
             and href[-1] != "#"
@@ -119,18 +204,75 @@ class Scraper:
         )
         return set(hrefs)
 
-    async def fetch_directory_contents(self, driver, directory: Directory):
-        links = await self._get_all_links(driver, directory.url)
+    async def _fetch_links(self, url: str) -> Optional[List[str]]:
+        """
+        Fetch a plain index page and parse its links, returns None when the page needs a browser
+        """
+        try:
+            async with self.session.get(url) as response:
+                if response.status != 200 or "html" not in response.content_type:
+                    return None
+                body = await response.read()
+                base_url = str(response.url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"Failed to fetch {url}: {e}")
+            return None
+
+        document = lxml.html.fromstring(body, base_url=base_url)
+        document.make_links_absolute(resolve_base_href=True)
+        return document.xpath("//a/@href") or None
+
+    async def _fetch_links_with_browser(self, url: str) -> List[str]:
+        async with self.browser_lock:
+            if self.driver is None:
+                options = webdriver.ChromeOptions()
+                options.headless = self.config.HEADLESS
+                self.driver = await webdriver.Chrome(options=options)
+
+            await self.driver.get(url)
+            return await self.driver.execute_script(
+                "return Array.from(document.querySelectorAll('a[href]'), a => a.href)"
+            )
+
+    async def crawl(self):
+        """
+        Crawl the directory tree breadth-first with CRAWL_WORKERS concurrent workers
+        """
+        self.visited.add(self.data.url)
+        await self.crawl_queue.put(self.data)
+
+        workers = [asyncio.create_task(self.crawl_worker(i)) for i in range(self.config.CRAWL_WORKERS)]
+        await self.crawl_queue.join()
+
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def crawl_worker(self, worker_id: int):
+        while True:
+            directory = await self.crawl_queue.get()
+            try:
+                await self.fetch_directory_contents(directory)
+            except Exception as e:
+                self.crawl_errors += 1
+                logging.error(f"Crawl worker {worker_id} failed on {directory.url}: {e}")
+            finally:
+                self.crawl_queue.task_done()
+
+    async def fetch_directory_contents(self, directory: Directory):
+        links = await self._get_all_links(directory.url)
         logging.info(f"Found {len(links)} links in {directory.url}")
         for link in links:
-            if link in SKIP:
+            if link in SKIP or link in self.visited:
                 continue
+            self.visited.add(link)
+
             if self.is_directory(link):
                 subdirectory = Directory(
                     url=link, name=link.split("/")[-1], parent=directory
                 )
                 directory.directories.append(subdirectory)
-                await self.fetch_directory_contents(driver, subdirectory)
+                await self.crawl_queue.put(subdirectory)
             else:
                 file_obj = File(url=link, name=link.split("/")[-1], parent=directory)
                 directory.files.append(file_obj)
@@ -139,35 +281,48 @@ class Scraper:
                 ext = file_obj.name.split(".")[-1]
                 if ext in ["pdf", "txt", "csv", "json", "md"]:
                     logging.info(f"Adding {file_obj.url} to download queue")
+                    self.crawled_urls.add(file_obj.url)
                     await self.download_queue.put((file_obj, download_path))
 
-    async def manage_downloads(self):
+    async def download_worker(self, worker_id: int):
         try:
             while True:
-                if self.download_queue.empty() and self.total_downloaded_size >= self.storage_limit:
-                    # If the storage limit is reached and no more items are in the queue, exit gracefully.
-                    logging.info("Storage limit reached, stopping download manager.")
-                    return
                 file, directory_path = await self.download_queue.get()
-                await self.download_file(file, directory_path)
-                self.download_queue.task_done()
+                try:
+                    await self.download_file(file, directory_path)
+                except Exception as e:
+                    logging.error(f"Download worker {worker_id} failed on {file.url}: {e}")
+                finally:
+                    self.download_queue.task_done()
         except asyncio.CancelledError:
-            logging.info("Download manager task was cancelled.")
+            logging.info(f"Download worker {worker_id} was cancelled.")
 
     async def run(self):
-        options = webdriver.ChromeOptions()
-        options.headless = True
-        async with webdriver.Chrome(options=options) as driver:
-            download_manager = asyncio.create_task(self.manage_downloads())
-            await self.download_queue.join()
+        connector = aiohttp.TCPConnector(limit_per_host=self.config.PER_HOST_CONNECTIONS)
+        try:
+            async with aiohttp.ClientSession(connector=connector) as self.session:
+                workers = [
+                    asyncio.create_task(self.download_worker(i)) for i in range(self.config.WORKERS)
+                ]
 
-            await self.fetch_directory_contents(driver, self.data)
+                await self.crawl()
+                await self.download_queue.join()
 
-            download_manager.cancel()
-            try:
-                await download_manager
-            except asyncio.CancelledError:
-                logging.info("Download manager was cancelled successfully.")
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+            self.detect_deleted_files()
+            self.changes.save(self.config.CHANGES_FILE)
+            logging.info(
+                f"Crawl finished: {len(self.changes.added)} added, {len(self.changes.modified)} modified, "
+                f"{len(self.changes.deleted)} deleted, {self.changes.unchanged} unchanged"
+            )
+        finally:
+            if self.driver is not None:
+                await self.driver.quit()
+            self.url_hash_mapping.close()
+            self.crawl_state.close()
 
     def is_directory(self, url: str) -> bool:
         if "." in url.replace(self.config.URL, ""):
@@ -0,0 +1,70 @@
+import json
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+from qdrant_client import models
+
+from scraper import config
+
+SPARSE_VECTOR_NAME = "bm25"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def token_index(token: str) -> int:
+    """
+    Stable index of a token in the sparse vector, the API hashes query tokens the same way
+    """
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def encode_document(text: str) -> models.SparseVector:
+    """
+    BM25 term-frequency weights of the document, the IDF part is applied to the query by the API
+    """
+    counts = Counter(token_index(token) for token in tokenize(text))
+    length = sum(counts.values())
+    norm = config.BM25_K1 * (1 - config.BM25_B + config.BM25_B * length / config.BM25_AVG_LENGTH)
+
+    return models.SparseVector(
+        indices=list(counts.keys()),
+        values=[tf * (config.BM25_K1 + 1) / (tf + norm) for tf in counts.values()],
+    )
+
+
+class SparseStats:
+    """
+    Number of documents and document frequency of every token index, used by the API to compute IDF.
+    Incremental updates only ever add documents, so the counts drift until the next rebuild.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.documents = 0
+        self.df: Dict[int, int] = Counter()
+
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.documents = data["documents"]
+            self.df.update({int(index): count for index, count in data["df"].items()})
+        except FileNotFoundError:
+            pass
+
+    def add(self, sparse_vector: models.SparseVector):
+        self.documents += 1
+        self.df.update(sparse_vector.indices)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"documents": self.documents, "df": self.df}, f)
+        os.replace(tmp_path, self.path)
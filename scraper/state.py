@@ -0,0 +1,111 @@
+import json
+import sqlite3
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Dict, List, Optional
+
+
+@dataclass
+class FileState:
+    url: str
+    path: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    size: Optional[int] = None
+    content_hash: Optional[str] = None
+
+
+class CrawlState:
+    """
+    State of every downloaded file from the previous crawls, used to send conditional requests.
+    Lookups are served from memory, updates are written to SQLite in batches of `flush_size`.
+    """
+
+    def __init__(self, path: str, flush_size: int = 100):
+        self.path = path
+        self.flush_size = flush_size
+        self._connection: Optional[sqlite3.Connection] = None
+        self._states: Optional[Dict[str, FileState]] = None
+        self._pending: Dict[str, Optional[FileState]] = {}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS crawl_state ("
+                "url TEXT PRIMARY KEY, path TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+                "size INTEGER, content_hash TEXT)"
+            )
+        return self._connection
+
+    @property
+    def states(self) -> Dict[str, FileState]:
+        if self._states is None:
+            columns = ", ".join(field.name for field in fields(FileState))
+            self._states = {
+                row[0]: FileState(*row)
+                for row in self.connection.execute(f"SELECT {columns} FROM crawl_state")
+            }
+        return self._states
+
+    def get(self, url: str) -> Optional[FileState]:
+        return self.states.get(url)
+
+    def update(self, state: FileState):
+        self.states[state.url] = state
+        self._pending[state.url] = state
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def remove(self, url: str):
+        self.states.pop(url, None)
+        self._pending[url] = None
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM crawl_state WHERE url = ?",
+                [(url,) for url, state in self._pending.items() if state is None],
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO crawl_state VALUES (?, ?, ?, ?, ?, ?)",
+                [tuple(asdict(state).values()) for state in self._pending.values() if state is not None],
+            )
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+@dataclass
+class ChangeSet:
+    """
+    Files changed by a crawl, consumed by `scraper/insert_data.py --changes`
+    """
+
+    added: List[str]
+    modified: List[str]
+    deleted: List[str]
+    unchanged: int = 0
+
+    @classmethod
+    def empty(cls) -> "ChangeSet":
+        return cls(added=[], modified=[], deleted=[])
+
+    @classmethod
+    def load(cls, path: str) -> "ChangeSet":
+        with open(path, "r") as f:
+            data = json.load(f)
+        data.pop("crawled_at", None)
+        return cls(**data)
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"crawled_at": time.time(), **asdict(self)}, f, indent=4)
@@ -0,0 +1,136 @@
+import logging
+import multiprocessing
+import signal
+import uuid
+from collections import Counter, deque
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from scraper.chunking import chunk_text, get_tokenizer
+from scraper.parsers import FileParser, get_url_hash
+
+logger = logging.getLogger(__name__)
+
+
+class ParseTimeoutError(Exception):
+    pass
+
+
+def parse_file(filepath: str) -> List[dict]:
+    """
+    Parse and chunk a file page by page, runs in a worker process
+    """
+    data = FileParser(filepath).parse()
+    url_hash = get_url_hash(filepath)
+
+    points = []
+    occurrences = Counter()
+    for page_number, page in enumerate(data.pages):
+        for chunk in chunk_text(page, filepath):
+            # Deterministic ids, unchanged chunks keep their points between runs. Repeated chunks (headers, footers)
+            # are told apart by their occurrence, so every position gets its own point.
+            occurrence = occurrences[chunk]
+            occurrences[chunk] += 1
+            id_ = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{url_hash}:{occurrence}:{chunk}"))
+
+            points.append({
+                "id": id_,
+                "content": chunk,
+                "metadata": {
+                    "filename": data.filename,
+                    "path": data.path,
+                    "title": data.title,
+                    # Position in the file, the API merges chunks that follow each other
+                    "page": page_number,
+                    "chunk": len(points),
+                },
+            })
+    return points
+
+
+def _raise_timeout(signum, frame):
+    raise ParseTimeoutError()
+
+
+def parse_file_with_timeout(filepath: str, timeout: float) -> List[dict]:
+    """
+    Parse a file, interrupted with SIGALRM once it has been parsing for `timeout` seconds.
+    Runs in the main thread of a worker process (or of the scraper, without workers).
+    """
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return parse_file(filepath)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class ParserPool:
+    """
+    Parses files in a pool of processes, yielding results in input order.
+    A file parsing for longer than `timeout` is interrupted inside its worker and skipped. A worker stuck in native
+    code, where the interruption can't reach it, or killed by a crash, is given up on after twice the timeout
+    and the pool is restarted, so no file can hang the run.
+    """
+
+    def __init__(self, workers: int, timeout: float):
+        self.workers = workers
+        self.timeout = timeout
+
+    def imap(self, filepaths: Iterable[str]) -> Iterator[Tuple[str, Optional[List[dict]]]]:
+        if self.workers <= 0:
+            for filepath in filepaths:
+                yield filepath, self._parse_in_process(filepath)
+            return
+
+        filepaths = iter(filepaths)
+        pending = deque()
+        # Forked workers inherit it instead of each loading it
+        get_tokenizer()
+        pool = multiprocessing.Pool(processes=self.workers)
+        try:
+            while True:
+                # Keep a bounded window of files in flight
+                while len(pending) < self.workers * 2 and (filepath := next(filepaths, None)) is not None:
+                    pending.append((filepath, self._submit(pool, filepath)))
+                if not pending:
+                    break
+
+                filepath, result = pending.popleft()
+                try:
+                    # The file started parsing before any younger one, so it's running by now
+                    yield filepath, result.get(timeout=self.timeout * 2)
+                except ParseTimeoutError:
+                    logger.error(f"Parsing timed out after {self.timeout}s, skipping file: {filepath}")
+                    yield filepath, None
+                except multiprocessing.TimeoutError:
+                    logger.error(f"Parser worker is stuck or died, restarting the pool, skipping file: {filepath}")
+                    pool = self._restart(pool, pending)
+                    yield filepath, None
+                except Exception as e:
+                    logger.error(f"Failed to parse file: {filepath}, error: {e}")
+                    yield filepath, None
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _submit(self, pool, filepath: str):
+        return pool.apply_async(parse_file_with_timeout, (filepath, self.timeout))
+
+    def _restart(self, pool, pending: deque):
+        # Pool.terminate kills the workers, including one stuck in a task
+        pool.terminate()
+        pool.join()
+        pool = multiprocessing.Pool(processes=self.workers)
+        for i, (filepath, _) in enumerate(pending):
+            pending[i] = (filepath, self._submit(pool, filepath))
+        return pool
+
+    def _parse_in_process(self, filepath: str) -> Optional[List[dict]]:
+        try:
+            return parse_file_with_timeout(filepath, self.timeout)
+        except ParseTimeoutError:
+            logger.error(f"Parsing timed out after {self.timeout}s, skipping file: {filepath}")
+        except Exception as e:
+            logger.error(f"Failed to parse file: {filepath}, error: {e}")
+        return None